@@ -0,0 +1,2 @@
+from .generator import ProjectSpec, generate_project
+from .runner import format_results, measure, run_benchmarks
@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+
+from .generator import ProjectSpec
+from .runner import format_results, run_benchmarks
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="time mtm against a generated project")
+    parser.add_argument("--keys", type=int, default=1000, help="keys per string dir")
+    parser.add_argument("--languages", type=int, default=5, help="translated languages per platform")
+    parser.add_argument("--string-dirs", type=int, default=1)
+    parser.add_argument("--plural-ratio", type=float, default=0.05)
+    parser.add_argument("--placeholder-density", type=float, default=0.2)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--platforms", default="android,ios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memory", action="store_true", help="also record peak traced memory")
+    parser.add_argument("--path", help="generate the project here and keep it")
+    parser.add_argument("--output", help="write the json report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    spec = ProjectSpec(
+        keys=args.keys,
+        languages=args.languages,
+        string_dirs=args.string_dirs,
+        plural_ratio=args.plural_ratio,
+        placeholder_density=args.placeholder_density,
+        duplicate_ratio=args.duplicate_ratio,
+        platforms=args.platforms.split(","),
+        seed=args.seed,
+    )
+    report = run_benchmarks(spec, args.repeat, args.memory, args.path)
+    print(format_results(report), file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
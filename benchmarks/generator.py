@@ -0,0 +1,136 @@
+import json
+import os
+import random
+from xml.sax.saxutils import escape
+
+from mtm.utilities import get_generic_language
+
+WORDS = (
+    "account", "add", "back", "cancel", "change", "confirm", "delete", "done", "edit", "error",
+    "favorite", "help", "home", "item", "language", "loading", "message", "next", "open", "order",
+    "password", "profile", "retry", "save", "search", "settings", "share", "sign", "update", "welcome",
+)
+ANDROID_PLACEHOLDERS = ("%1$s", "%2$d", "%s", "%d", "%.2f")
+IOS_PLACEHOLDERS = ("%1$@", "%2$d", "%@", "%d", "%.2f")
+
+
+class ProjectSpec:
+
+    def __init__(self, keys=1000, languages=5, string_dirs=1, plural_ratio=0.05, placeholder_density=0.2,
+                 duplicate_ratio=0.1, platforms=("android", "ios"), seed=0):
+        self.keys = keys
+        self.languages = languages
+        self.string_dirs = string_dirs
+        self.plural_ratio = plural_ratio
+        self.placeholder_density = placeholder_density
+        self.duplicate_ratio = duplicate_ratio
+        self.platforms = tuple(platforms)
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__, platforms=list(self.platforms))
+
+    @property
+    def locales(self):
+        # (android qualifier, ios lproj) pairs that map to the same generic language
+        return [(f"l{index}-rXX", f"l{index}-XX") for index in range(self.languages)]
+
+
+def _get_entries(spec, random_generator, key_prefix):
+    # [(key, words, placeholder slots, is_plural)]; duplicates reuse the text of an earlier entry
+    entries = []
+    for index in range(spec.keys):
+        key = f"{key_prefix}_key_{index}"
+        is_plural = random_generator.random() < spec.plural_ratio
+        if entries and random_generator.random() < spec.duplicate_ratio:
+            _, words, slots, _ = random_generator.choice(entries)
+        else:
+            words = [random_generator.choice(WORDS) for _ in range(random_generator.randint(1, 6))] + [str(index)]
+            slots = sorted(
+                random_generator.randrange(len(words) + 1)
+                for _ in range(len(words)) if random_generator.random() < spec.placeholder_density
+            )
+        entries.append((key, words, slots, is_plural))
+    return entries
+
+
+def _render(words, slots, placeholders, prefix=""):
+    parts = list(words)
+    for offset, slot in enumerate(slots):
+        parts.insert(slot + offset, placeholders[offset % len(placeholders)])
+    return f"{prefix}{' '.join(parts)}"
+
+
+def _write_android(directory, entries, prefix=""):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "strings.xml"), "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write('<resources xmlns:tools="http://schemas.android.com/tools" tools:ignore="MissingTranslation">\n')
+        for key, words, slots, is_plural in entries:
+            value = escape(_render(words, slots, ANDROID_PLACEHOLDERS, prefix))
+            if is_plural:
+                f.write(f'    <plurals name="{key}" tools:ignore="UnusedQuantity">\n')
+                f.write(f'        <item quantity="one">{value}</item>\n')
+                f.write(f'        <item quantity="other">{value} %d</item>\n')
+                f.write('    </plurals>\n')
+            else:
+                f.write(f'    <string name="{key}">{value}</string>\n')
+        f.write('</resources>\n')
+
+
+def _write_ios(directory, entries, prefix=""):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "Localizable.strings"), "w", encoding="utf-8") as f:
+        for key, words, slots, is_plural in entries:
+            if is_plural:
+                continue
+            f.write(f'/* No comment provided by engineer. */\n"{key}" = "{_render(words, slots, IOS_PLACEHOLDERS, prefix)}";\n\n')
+
+
+def generate_project(path, spec):
+    # writes android and ios string trees plus a config.json under path, returns the config path
+    random_generator = random.Random(spec.seed)
+    applications = []
+    for string_dir_index in range(spec.string_dirs):
+        string_dir = f"module{string_dir_index}"
+        entries = _get_entries(spec, random_generator, string_dir)
+        if "android" in spec.platforms:
+            res_dir = os.path.join(path, "android", string_dir, "res")
+            _write_android(os.path.join(res_dir, "values"), entries)
+            for android_locale, _ in spec.locales:
+                _write_android(os.path.join(res_dir, f"values-{android_locale}"), entries, f"[{get_generic_language(android_locale)}] ")
+        if "ios" in spec.platforms:
+            ios_dir = os.path.join(path, "ios", string_dir)
+            _write_ios(os.path.join(ios_dir, "en.lproj"), entries)
+            for _, ios_locale in spec.locales:
+                _write_ios(os.path.join(ios_dir, f"{ios_locale}.lproj"), entries, f"[{get_generic_language(ios_locale)}] ")
+
+    string_dirs = [f"module{index}" for index in range(spec.string_dirs)]
+    if "android" in spec.platforms:
+        applications.append({
+            "platform": "android",
+            "project_dir": "android",
+            "strings_filename": "strings.xml",
+            "languages": ["", *[android_locale for android_locale, _ in spec.locales]],
+            "default_language": "",
+            "string_dirs": [f"{string_dir}/res/values" for string_dir in string_dirs],
+        })
+    if "ios" in spec.platforms:
+        applications.append({
+            "platform": "ios",
+            "project_dir": "ios",
+            "strings_filename": "Localizable.strings",
+            "languages": ["en", *[ios_locale for _, ios_locale in spec.locales]],
+            "default_language": "en",
+            "string_dirs": string_dirs,
+        })
+
+    config_path = os.path.join(path, "config.json")
+    with open(config_path, "w") as f:
+        json.dump({
+            "string_index_filename": "string_index.json",
+            "sheets_api": {"spreadsheet_id": "local"},
+            "parse_cache": False,
+            "applications": applications,
+        }, f, indent=4)
+    return config_path
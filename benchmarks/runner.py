@@ -0,0 +1,188 @@
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+
+from mtm import manager
+from mtm.android import AndroidStringFile
+from mtm.ios import iOSStringFile
+from mtm.lint import lint_index
+from mtm.map import StringsMap, strings_map_to_dict
+from mtm.schema import StringsMapSchema
+from mtm.sheets import LocalWorksheet
+from mtm.storage import get_storage
+
+from .generator import generate_project
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# a cold cli run should be through its imports and config well within this
+STARTUP_BUDGET_SECONDS = 0.1
+HEAVY_MODULES = ("gspread", "marshmallow", "lxml", "munch", "bs4", "lib2to3")
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import manager_script
+from mtm import manager
+manager.Session(sys.argv[1])
+print(time.perf_counter() - start)
+print(",".join(sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[2].split(",")))))
+"""
+
+
+@contextmanager
+def working_directory(path):
+    # the manager resolves the index and backups relative to the working directory
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def measure(function, repeat=1, memory=False, setup=None):
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            runs.append(time.perf_counter() - start)
+    result = {"seconds": min(runs), "runs": runs}
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            with redirect_stdout(io.StringIO()):
+                function()
+            result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def measure_retained(function):
+    # bytes still allocated while the result of function is alive, i.e. the size of the model it builds
+    with redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - start
+            retained = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+    del result
+    return {"seconds": seconds, "runs": [seconds], "retained_memory_bytes": retained}
+
+
+def measure_startup(config_path, repeat=3):
+    # each run is a fresh interpreter importing the cli and loading the config, everything a cold --save
+    # does before it reads the first string file; interpreter startup itself is not counted
+    runs = []
+    heavy_modules = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, config_path, ",".join(HEAVY_MODULES)],
+            cwd=ROOT_DIRECTORY, check=True, capture_output=True, text=True
+        ).stdout.splitlines()
+        runs.append(float(output[0]))
+        heavy_modules = [name for name in output[1].split(",") if name]
+    return {
+        "seconds": min(runs),
+        "runs": runs,
+        "budget_seconds": STARTUP_BUDGET_SECONDS,
+        "within_budget": min(runs) < STARTUP_BUDGET_SECONDS,
+        "heavy_modules": heavy_modules,
+    }
+
+
+def _benchmark_entry_points(config_path, repeat, memory):
+    config = manager.get_config(config_path)
+
+    def remove_index():
+        if os.path.exists(config.string_index_filename):
+            os.remove(config.string_index_filename)
+
+    worksheet = LocalWorksheet()
+    return {
+        "startup": measure_startup(config_path, repeat),
+        "manager.init": measure(lambda: manager.init(config_path), repeat, memory, setup=remove_index),
+        "manager.sync": measure(lambda: manager.Session(config_path, worksheet=worksheet).run("sync"), repeat, memory),
+        "manager.save": measure(lambda: manager.Session(config_path).run("save"), repeat, memory),
+        "manager.deploy": measure(lambda: manager.Session(config_path, worksheet=worksheet).run("sync", "upload"), repeat, memory),
+    }
+
+
+def _benchmark_hot_paths(config_path, repeat, memory):
+    config = manager.get_config(config_path)
+    string_files = manager._get_string_files(config)
+    languages = manager._get_generic_languages(config)
+    android_args = [(f.filepath, f.language, f.default) for f in string_files if isinstance(f, AndroidStringFile)]
+    ios_args = [(f.filepath, f.language, f.default) for f in string_files if isinstance(f, iOSStringFile)]
+    strings_map = StringsMap(string_files, languages)
+    return {
+        "AndroidStringFile.parse": measure(lambda: [AndroidStringFile(*args) for args in android_args], repeat, memory),
+        "iOSStringFile.parse": measure(lambda: [iOSStringFile(*args) for args in ios_args], repeat, memory),
+        "StringsMap._map": measure(lambda: StringsMap(string_files, languages), repeat, memory),
+        "StringFile.update_values": measure(lambda: [f.update_values(strings_map) for f in string_files], repeat, memory),
+        "StringsMapSchema.dumps": measure(
+            lambda: StringsMapSchema().dumps(strings_map, indent=4, ensure_ascii=False, sort_keys=True), repeat, memory
+        ),
+        "strings_map_to_dict.dumps": measure(
+            lambda: json.dumps(strings_map_to_dict(strings_map), indent=4, ensure_ascii=False, sort_keys=True), repeat, memory
+        ),
+        "lint_index": measure(lambda: lint_index(strings_map, languages), repeat, memory),
+    }
+
+
+def _benchmark_model_memory(config_path):
+    config = manager.get_config(config_path)
+    storage = get_storage(config)
+    return {
+        "model.string_files": measure_retained(lambda: manager._get_string_files(config)),
+        "model.strings_map": measure_retained(storage.load),
+    }
+
+
+def run_benchmarks(spec, repeat=3, memory=False, path=None):
+    # generates a project for spec (in a temporary directory unless path is given) and times every stage on it
+    directory = path if path else tempfile.mkdtemp(prefix="mtm-benchmark-")
+    try:
+        config_path = os.path.abspath(generate_project(directory, spec))
+        with working_directory(directory):
+            results = _benchmark_entry_points(config_path, repeat, memory)
+            results.update(_benchmark_hot_paths(config_path, repeat, memory))
+            results.update(_benchmark_model_memory(config_path))
+    finally:
+        if not path:
+            shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "spec": spec.to_dict(),
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def format_results(report):
+    lines = []
+    for name, result in report["results"].items():
+        detail = ""
+        if "peak_memory_bytes" in result:
+            detail = f'{result["peak_memory_bytes"] / 1024 / 1024:10.1f} MiB'
+        elif "retained_memory_bytes" in result:
+            detail = f'{result["retained_memory_bytes"] / 1024 / 1024:10.1f} MiB retained'
+        elif "budget_seconds" in result:
+            detail = f'  {"within" if result["within_budget"] else "OVER"} {result["budget_seconds"] * 1000:.0f} ms budget'
+        lines.append(f'{name:32}{result["seconds"] * 1000:12.1f} ms{detail}')
+    return "\n".join(lines)
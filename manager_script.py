@@ -1,38 +1,74 @@
+from datetime import datetime
 import getopt
+import json
 import sys
 
-from mtm.manager import init, save, deploy, sync
+from mtm import instrumentation
+from mtm.manager import Session, init, export_index, find_duplicates, find_strings, get_history, import_index, lint, restore_index, rollback
 
 
 def main(argv):
     help_message =  """
 usage: manager.py [-h] -c <path to config file> [init, -s, --save, -d]
+       manager.py -c <config> -c <config> ... [--sync, --save, -d] [--jobs <n>] [--batch-json <path>]
 
 optional arguments:
         init\t\tcreate a strings index file based on the current project files
         -h, --help\t\tshow this help message and exit
-        -c, --config\t\tpath to config file
+        -c, --config\t\tpath to config file, repeat it to run the stages for several projects in one batch
         -s, --sync\t\sync the values in index file with google sheet and project files
         -d, --update\t\tdeploy index file to google sheet
         --save\t\tsave values from index file into the project files
+        --watch\t\tkeep running and sync project string edits into the index as they happen
+        --find\t\tshow the strings with a key or value and their translations, a sqlite index only reads those rows
+        --duplicates\t\tlist clusters of near duplicate source strings in the index
+        --lint\t\tcheck translations for placeholder mismatches, missing plurals, untranslated, fuzzy and orphan keys
+        --lint-json\t\tlint and write the issues as json to a file, - for stdout; exits with 1 on errors
+        --history\t\tlist the commits in the index journal
+        --restore\t\trestore the index to a journal commit number or an iso date and time
+        --rollback\t\tundo the last journal commit
+        --export\t\texport the index to a json file
+        --import\t\treplace the index with the contents of a json file
+        --jobs\t\tnumber of projects a batch runs at the same time (default 4)
+        --batch-json\t\twrite the batch report as json to a file
+        --validate\t\tread and write the index through its validating schema (slower)
+        --profile\t\tprint phase timings and counters when done
+        --stats-json\t\twrite phase timings and counters to a json file
+        --cprofile\t\twrite cProfile stats for the whole run to a file
     """
     try:
-        opts, args = getopt.getopt(argv, "hc:d", ["init", "sync", "save"])
+        opts, args = getopt.getopt(argv, "hc:d", ["init", "sync", "save", "watch", "duplicates", "find=", "lint", "lint-json=", "history", "restore=", "rollback", "export=", "import=", "jobs=", "batch-json=", "validate", "profile", "stats-json=", "cprofile="])
     except getopt.GetoptError:
         print(help_message)
         sys.exit(2)
 
-    config_path = None
+    config_paths = []
+    jobs = None
+    batch_json_path = None
     should_init = False
     should_save = False
     should_deploy = False
     should_sync = False
+    should_watch = False
+    should_find_duplicates = False
+    find_text = None
+    should_lint = False
+    lint_json_path = None
+    should_show_history = False
+    restore_target = None
+    should_rollback = False
+    export_path = None
+    import_path = None
+    validate = False
+    should_profile = False
+    stats_json_path = None
+    cprofile_path = None
     for opt, arg in opts:
         if opt in ('-h', '--help'):
             print(help_message)
             sys.exit()
         elif opt in ("-c", "--config"):
-            config_path = arg
+            config_paths.append(arg)
         elif opt in ("--save"):
             should_save = True
         elif opt in ("-d", "--deploy"):
@@ -41,21 +77,169 @@ optional arguments:
             should_sync = True
         elif opt in ("--init"):
             should_init = True
+        elif opt == "--watch":
+            should_watch = True
+        elif opt == "--duplicates":
+            should_find_duplicates = True
+        elif opt == "--find":
+            find_text = arg
+        elif opt == "--lint":
+            should_lint = True
+        elif opt == "--lint-json":
+            lint_json_path = arg
+        elif opt == "--history":
+            should_show_history = True
+        elif opt == "--restore":
+            restore_target = arg
+        elif opt == "--rollback":
+            should_rollback = True
+        elif opt == "--export":
+            export_path = arg
+        elif opt == "--import":
+            import_path = arg
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--batch-json":
+            batch_json_path = arg
+        elif opt == "--validate":
+            validate = True
+        elif opt == "--profile":
+            should_profile = True
+        elif opt == "--stats-json":
+            stats_json_path = arg
+        elif opt == "--cprofile":
+            cprofile_path = arg
     
-    if not config_path:
+    if not config_paths:
         print(help_message)
         sys.exit(2)
+    config_path = config_paths[0]
+    stages = get_stages(should_sync, should_save, should_deploy)
+    if len(config_paths) > 1 and (should_init or import_path or export_path or should_watch or should_find_duplicates or find_text
+                                  or should_lint or lint_json_path or should_show_history or restore_target or should_rollback):
+        print("only --sync, --save and -d can run for several configs at once")
+        sys.exit(2)
+
+    if should_profile or stats_json_path or cprofile_path:
+        instrumentation.enable(profile=bool(cprofile_path))
+    try:
+        if len(config_paths) > 1:
+            run_batch_stages(config_paths, stages, jobs, validate, batch_json_path)
+            return
+        run(config_path, validate, should_init, should_sync, should_save, should_deploy, import_path, export_path, should_watch, should_find_duplicates, find_text, should_lint, lint_json_path, should_show_history, restore_target, should_rollback)
+    finally:
+        instrumentation.disable()
+        if should_profile:
+            print(instrumentation.format_report())
+        if stats_json_path:
+            with open(stats_json_path, 'w') as f:
+                json.dump(instrumentation.get_report(), f, indent=4)
+        if cprofile_path:
+            instrumentation.dump_profile(cprofile_path)
+
 
+def run(config_path, validate, should_init, should_sync, should_save, should_deploy, import_path, export_path, should_watch, should_find_duplicates, find_text, should_lint, lint_json_path, should_show_history, restore_target, should_rollback):
     if should_init:
-        init(config_path)
+        init(config_path, validate)
         return
+    if import_path:
+        import_index(import_path, config_path, validate)
+    if restore_target:
+        if restore_target.isdigit():
+            restore_index(config_path, int(restore_target), validate=validate)
+        else:
+            restore_index(config_path, timestamp=datetime.fromisoformat(restore_target).timestamp(), validate=validate)
+    if should_rollback:
+        rollback(config_path, validate)
+    if should_show_history:
+        show_history(config_path)
+    # all stages share one session so the config, index and string files are only loaded once
+    stages = get_stages(should_sync, should_save, should_deploy)
+    if stages:
+        Session(config_path, validate).run(*stages)
+    if export_path:
+        export_index(export_path, config_path, validate)
+    if should_lint or lint_json_path:
+        run_lint(config_path, validate, lint_json_path)
+    if find_text is not None:
+        show_strings(config_path, validate, find_text)
+    if should_find_duplicates:
+        clusters = find_duplicates(config_path, validate=validate)
+        for values in clusters:
+            print(f"{len(values)} similar strings:")
+            for value in values:
+                print(f"    {value!r}")
+        print(f"{len(clusters)} clusters of near duplicate strings")
+    if should_watch:
+        from mtm.watch import watch
+        watch(config_path, validate)
+
+
+def get_stages(should_sync, should_save, should_deploy):
+    stages = []
     if should_sync:
-        sync(config_path)
+        stages.append("sync")
     if should_save:
-        save(config_path)
+        stages.append("save")
     if should_deploy:
-        deploy(config_path)
+        if not should_sync:
+            stages.append("sync")
+        stages.append("upload")
+    return stages
+
+
+def run_batch_stages(config_paths, stages, jobs, validate, json_path):
+    from mtm.batch import DEFAULT_JOBS, run_batch
+    if not stages:
+        print("nothing to run, pass --sync, --save or -d")
+        sys.exit(2)
+    runner = run_batch(config_paths, stages, jobs or DEFAULT_JOBS, validate)
+    print(runner.format_report())
+    report = runner.get_report()
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=4)
+    if report["failed"]:
+        sys.exit(1)
+
+
+def show_history(config_path):
+    commits, snapshots = get_history(config_path)
+    for commit in commits:
+        snapshot = " (snapshot)" if commit["commit"] in snapshots else ""
+        reason = f' {commit["reason"]}' if commit.get("reason") else ""
+        print(f'{commit["commit"]:6}  {datetime.fromtimestamp(commit["time"]).isoformat(timespec="seconds")}  {commit["records"]:8} changes{reason}{snapshot}')
+
+
+def show_strings(config_path, validate, text):
+    string_indexes = find_strings(key=text, config_path=config_path, validate=validate)
+    string_indexes.extend(
+        string_index for string_index in find_strings(value=text, config_path=config_path, validate=validate)
+        if string_index.value not in {found.value for found in string_indexes}
+    )
+    for string_index in string_indexes:
+        print(f"{string_index.value!r} ({', '.join(string_key.key for string_key in string_index.keys)})")
+        for language, translation in sorted(string_index.translations.items()):
+            print(f"    {language}: {translation!r}")
+    print(f"{len(string_indexes)} strings found")
+
 
+def run_lint(config_path, validate, json_path):
+    from contextlib import redirect_stdout
+    from mtm.lint import format_report, get_report
+    # progress output goes to stderr when stdout carries the json report
+    with redirect_stdout(sys.stderr if json_path == "-" else sys.stdout):
+        issues = lint(config_path, validate)
+    report = get_report(issues)
+    if json_path == "-":
+        print(json.dumps(report, indent=4, ensure_ascii=False))
+    else:
+        print(format_report(issues))
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(report, f, indent=4, ensure_ascii=False)
+    if report["errors"]:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -1,9 +1,47 @@
+from html import escape as escape_html
 import os
-from bs4 import BeautifulSoup
+from re import compile
+from lxml import etree
 from .strings import STRING_TYPE, PLURAL_TYPE, PluralItem, StringFile, StringItem
 
+TOOLS_NAMESPACE = '{http://schemas.android.com/tools}'
+
+# a backslash pair is skipped as a whole, so only apostrophes that are not escaped yet match on their own
+re_apostrophe = compile(r"(\\.)|'")
+re_escape = compile(r"\\(.)")
+
+
+def escape(value):
+    # same output as xml.sax.saxutils.escape, which would pull in urllib at import time
+    return escape_html(value, quote=False)
+
+
+def quoteattr(value):
+    # same output as xml.sax.saxutils.quoteattr
+    value = escape(value).replace('\n', '&#10;').replace('\r', '&#13;').replace('\t', '&#9;')
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return '"{}"'.format(value.replace('"', '&quot;'))
+
+
+def escape_value(value):
+    # values keep their android escapes; double quotes are left alone since they may delimit the value
+    if not value:
+        return ""
+    return re_apostrophe.sub(lambda match: match.group(1) or "\\'", escape(value))
+
+
+def unescape_value(value):
+    # undoes escape_value, so parse(write(value)) gives value back; other escapes like \n are kept as they are
+    if not value or "\\'" not in value:
+        return value
+    return re_escape.sub(lambda match: "'" if match.group(1) == "'" else match.group(0), value)
+
 
 class AndroidStringFile(StringFile):
+    platform = "android"
     
     @property
     def header(self):
@@ -12,24 +50,23 @@ class AndroidStringFile(StringFile):
             '<resources xmlns:tools="http://schemas.android.com/tools" tools:ignore=\"MissingTranslation\">\n'
         )
 
-    @property
-    def body(self):
-        body_string = ""
-        sorted_values = sorted(self.values, key=lambda x: x.key.lower())
-        for value in sorted_values:
+    def iter_body(self):
+        for value in self.sorted_values:
             value_type = value.type
             if value_type == STRING_TYPE:
                 # todo: if blank we need to get the default value from the default language file and set this field
                 translatable_value = f' translatable="false"' if not value.translatable else ""
-                body_string += f'    <string name="{value.key}"{translatable_value}>{value.value}</string>\n'
+                tools_value = self._tools_attributes(value.tools_attributes)
+                yield f'    <string name="{value.key}"{translatable_value}{tools_value}>{escape_value(value.value)}</string>\n'
             elif value_type == PLURAL_TYPE:
-                body_string += f'    <plurals name="{value.key}" tools:ignore="UnusedQuantity">\n'
-                for plural_item in value.plural_items:
-                    body_string += f'        <item quantity="{plural_item.quantity}">{plural_item.quantity_value}</item>\n'
-                body_string += f'    </plurals>\n'
+                tools_value = self._tools_attributes({'ignore': 'UnusedQuantity', **value.tools_attributes})
+                plural_items = "".join(
+                    f'        <item quantity="{plural_item.quantity}">{escape_value(plural_item.quantity_value)}</item>\n'
+                    for plural_item in value.plural_items
+                )
+                yield f'    <plurals name="{value.key}"{tools_value}>\n{plural_items}    </plurals>\n'
             else:
                 raise Exception("Invalid value type.")
-        return body_string
 
     @property
     def footer(self):
@@ -37,68 +74,79 @@ class AndroidStringFile(StringFile):
             '</resources>\n'
         )
 
+    def adapt_placeholder(self, placeholder):
+        # android has no %@, strings are formatted with %s
+        return f'{placeholder[:-1]}s' if placeholder.endswith('@') else placeholder
+
+    @staticmethod
+    def _tools_attributes(tools_attributes):
+        return "".join(f' tools:{name}={quoteattr(value)}' for name, value in tools_attributes.items())
+
     def parse(self):
+        def get_tools_attributes(element):
+            return {
+                name[len(TOOLS_NAMESPACE):]: value
+                for name, value in element.attrib.items()
+                if name.startswith(TOOLS_NAMESPACE)
+            }
+
         def get_plural_items(items):
             plural_items = []
             for item in items:
                 plural_items.append(
                     PluralItem(
-                        item['quantity'],
-                        item.text
+                        item.get('quantity'),
+                        unescape_value(''.join(item.itertext()))
                     )
                 )
             return plural_items
 
-        xml = open(self.filepath).read().encode('utf-8')
-        soup = BeautifulSoup(xml, features='xml')
         string_items = []
-        for xml_string in soup.findAll('string'):
-            string_items.append(
-                StringItem(
-                    xml_string['name'],
-                    STRING_TYPE,
-                    translatable=xml_string.get('translatable', None) != 'false',
-                    value=xml_string.text,
+        plural_items = []
+        # elements are cleared as soon as they are read so memory stays flat for large files
+        context = etree.iterparse(self.filepath, events=('end',), tag=('string', 'plurals'), recover=True, huge_tree=True)
+        for _, element in context:
+            if element.tag == 'string':
+                string_items.append(
+                    StringItem(
+                        element.get('name'),
+                        STRING_TYPE,
+                        translatable=element.get('translatable', None) != 'false',
+                        value=unescape_value(''.join(element.itertext())),
+                        tools_attributes=get_tools_attributes(element)
+                    )
                 )
-            )
-
-        for plurals in soup.findAll('plurals'):
-            items = plurals.findAll('item')
-            string_items.append(
-                StringItem(
-                    plurals['name'],
-                    PLURAL_TYPE,
-                    translatable=plurals.get('translatable', None) != 'false',
-                    plural_items=get_plural_items(items)
+            else:
+                plural_items.append(
+                    StringItem(
+                        element.get('name'),
+                        PLURAL_TYPE,
+                        translatable=element.get('translatable', None) != 'false',
+                        plural_items=get_plural_items(element.iter('item')),
+                        tools_attributes=get_tools_attributes(element)
+                    )
                 )
-            )
-        return string_items
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+        del context
+        return string_items + plural_items
 
     @staticmethod
-    def get_string_files(config):
-        string_files = []
-        for string_dir in config.string_dirs:
-            for language in config.languages:
-                strings_dir = f'{string_dir}-{language}' if language else string_dir
-                path = os.path.normpath(f'{config.project_dir}/{strings_dir}/{config.strings_filename}')
-                string_files.append(AndroidStringFile(path, language, language == config.default_language))
-        return string_files
+    def get_string_dir_args(config, string_dir):
+        string_file_args = []
+        for language in config.languages:
+            strings_dir = f'{string_dir}-{language}' if language else string_dir
+            path = os.path.normpath(f'{config.project_dir}/{strings_dir}/{config.strings_filename}')
+            string_file_args.append((path, language, language == config.default_language))
+        return string_file_args
 
+    @staticmethod
+    def get_string_file_args(config):
+        return [args for string_dir in config.string_dirs for args in AndroidStringFile.get_string_dir_args(config, string_dir)]
 
     @staticmethod
-    def populate_with_new_keys(config):
-        for string_dir in config.string_dirs:
-            default_file_path = os.path.normpath(f'{config.project_dir}/{string_dir}/{config.strings_filename}')
-            default_file = AndroidStringFile(default_file_path, config.default_language, True)
-            translatable_default_keys = set(map(lambda i: i.key, filter(lambda s: s.translatable, default_file.values)))
-            for language in config.languages:
-                if language == config.default_language:
-                    continue
-                strings_dir = f'{string_dir}-{language}' if language else string_dir
-                path = os.path.normpath(f'{config.project_dir}/{strings_dir}/{config.strings_filename}')
-                string_file = AndroidStringFile(path, language, False)
-                translatable_keys = set(map(lambda i: i.key, (filter(lambda s: s.translatable, string_file.values))))
-                if translatable_default_keys != translatable_keys:
-                    for key in translatable_default_keys - translatable_keys:
-                        string_file.insert_new_string_key(key)
-                    string_file.update_strings_file()
+    def get_string_files(config):
+        return [AndroidStringFile(*args) for args in AndroidStringFile.get_string_file_args(config)]
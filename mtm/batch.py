@@ -0,0 +1,165 @@
+import io
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import SharedParseCache
+from .manager import Session, _get_parse_cache, _get_string_file_jobs, _load_string_files, get_config
+from .output import capture, echo
+from .writer import PathLocks
+
+DEFAULT_JOBS = 4
+
+
+class Project:
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        # paths are resolved against the config so every project can run from the same working directory
+        self.config = get_config(config_path, relative_to_config=True)
+        self.parse_cache = None
+        self.status = "pending"
+        self.error = None
+        self.seconds = 0.0
+        self.timings = {}
+        self.files_written = 0
+        self.files_unchanged = 0
+        self.output = ""
+
+    def to_dict(self):
+        return {
+            "config": self.config_path,
+            "status": self.status,
+            "error": self.error,
+            "seconds": self.seconds,
+            "stages": self.timings,
+            "files_written": self.files_written,
+            "files_unchanged": self.files_unchanged,
+        }
+
+
+class BatchRunner:
+    # runs the same stages for many projects on a bounded thread pool. String files that several projects
+    # include are parsed once up front and handed to every project from a shared cache, and all projects use
+    # the one sheets client of the process
+
+    def __init__(self, config_paths, stages, jobs=DEFAULT_JOBS, validate=False, get_worksheet=None):
+        for stage in stages:
+            if stage not in Session.STAGES:
+                raise Exception(f"{stage} is not a supported stage")
+        self.projects = [Project(config_path) for config_path in config_paths]
+        self.stages = stages
+        self.jobs = max(1, jobs)
+        self.validate = validate
+        # get_worksheet(config) -> a worksheet stand-in, the project's google sheet when not given
+        self.get_worksheet = get_worksheet
+        self.shared_cache = SharedParseCache()
+        # a file that several projects include is replaced by one project at a time
+        self.path_locks = PathLocks()
+        self.preload_seconds = 0.0
+        self.seconds = 0.0
+        self._print_lock = threading.Lock()
+
+    def _capture(self, project, function, *args):
+        # whatever the project echoes while function runs goes to project.output
+        buffer = io.StringIO()
+        try:
+            with capture(buffer):
+                return function(project, *args)
+        finally:
+            project.output += buffer.getvalue()
+
+    def _preload(self, project, jobs):
+        _load_string_files(jobs, cache=project.parse_cache)
+
+    def preload(self, executor):
+        # every string file goes to the first project that includes it, so a shared file is parsed once
+        owners = {}
+        project_jobs = []
+        for position, project in enumerate(self.projects):
+            project.parse_cache = self.shared_cache.get_view(_get_parse_cache(project.config))
+            project_jobs.append([
+                job for job in _get_string_file_jobs(project.config)
+                if owners.setdefault(os.path.realpath(job[1]), position) == position
+            ])
+        futures = [
+            executor.submit(self._capture, project, self._preload, jobs)
+            for project, jobs in zip(self.projects, project_jobs) if jobs
+        ]
+        for future in futures:
+            future.result()
+
+    def _run_project(self, project):
+        start = time.perf_counter()
+        session = None
+        try:
+            worksheet = self.get_worksheet(project.config) if self.get_worksheet else None
+            session = Session(
+                project.config_path, self.validate, worksheet,
+                config=project.config, parse_cache=project.parse_cache, path_locks=self.path_locks
+            )
+            session.run(*self.stages)
+            project.status = "ok"
+        except Exception as e:
+            project.status = "failed"
+            project.error = str(e)
+            echo(f"!!! {e}")
+        finally:
+            project.seconds = time.perf_counter() - start
+            if session is not None:
+                project.timings = session.timings
+                project.files_written = len(session.writer.written)
+                project.files_unchanged = len(session.writer.unchanged)
+
+    def _run(self, project):
+        self._capture(project, self._run_project)
+        with self._print_lock:
+            sys.stdout.write(f"===== {project.config_path} ({project.status}, {project.seconds:.2f}s)\n{project.output}")
+
+    def run(self):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            self.preload(executor)
+            self.preload_seconds = time.perf_counter() - start
+            for future in [executor.submit(self._run, project) for project in self.projects]:
+                future.result()
+        self.seconds = time.perf_counter() - start
+        return self
+
+    def get_report(self):
+        return {
+            "stages": list(self.stages),
+            "jobs": self.jobs,
+            "seconds": self.seconds,
+            "preload_seconds": self.preload_seconds,
+            "project_seconds": sum(project.seconds for project in self.projects),
+            "shared_files": len(self.shared_cache.entries),
+            "shared_cache_hits": self.shared_cache.hits,
+            "failed": sum(1 for project in self.projects if project.status != "ok"),
+            "projects": [project.to_dict() for project in self.projects],
+        }
+
+    def format_report(self):
+        report = self.get_report()
+        stages = [*self.stages, "persist"]
+        lines = [f'{"project":40}{"status":>8}{"seconds":>10}' + "".join(f"{stage:>10}" for stage in stages) + f'{"written":>9}']
+        for project in self.projects:
+            lines.append(
+                f"{project.config_path[-40:]:40}{project.status:>8}{project.seconds:10.2f}"
+                + "".join(f"{project.timings.get(stage, 0.0):10.2f}" for stage in stages)
+                + f"{project.files_written:9}"
+            )
+        lines.append("")
+        lines.append(
+            f'{len(self.projects)} projects in {report["seconds"]:.2f}s with {self.jobs} jobs '
+            f'({report["project_seconds"]:.2f}s of project time, {report["preload_seconds"]:.2f}s parsing up front)'
+        )
+        lines.append(f'{report["shared_files"]} string files parsed once, {report["shared_cache_hits"]} reused from the shared cache')
+        lines.append(f'{report["failed"]} projects failed')
+        return "\n".join(lines)
+
+
+def run_batch(config_paths, stages, jobs=DEFAULT_JOBS, validate=False, get_worksheet=None):
+    return BatchRunner(config_paths, stages, jobs, validate, get_worksheet).run()
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import pickle
+import threading
+
+from .output import echo
+
+# bump whenever the parsed StringItem layout changes so stale caches are discarded
+CACHE_VERSION = 3
+
+
+def get_fingerprint(filepath):
+    stat = os.stat(filepath)
+    with open(filepath, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return stat.st_size, stat.st_mtime_ns, digest
+
+
+class ParseCache:
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.has_changes = False
+        self._fingerprints = {}
+        self._read_from_file()
+
+    def _read_from_file(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                version, entries = pickle.load(f)
+        except Exception as e:
+            echo(f"!!! ignoring unreadable parse cache {self.path}: {e}")
+            return
+        if version == CACHE_VERSION:
+            self.entries = entries
+
+    def get(self, filepath):
+        # size and mtime are checked first so unchanged files are never read
+        entry = self.entries.get(filepath)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        if entry:
+            size, mtime, digest, values = entry
+            if stat.st_size == size and stat.st_mtime_ns == mtime:
+                return values
+        fingerprint = get_fingerprint(filepath)
+        self._fingerprints[filepath] = fingerprint
+        if entry and fingerprint[0] == size and fingerprint[2] == digest:
+            self.entries[filepath] = (*fingerprint, values)
+            self.has_changes = True
+            return values
+        return None
+
+    def put(self, filepath, values):
+        # the fingerprint taken before parsing is used so a concurrent edit is picked up next run
+        fingerprint = self._fingerprints.pop(filepath, None) or get_fingerprint(filepath)
+        self.entries[filepath] = (*fingerprint, values)
+        self.has_changes = True
+
+    def save(self):
+        if not self.has_changes:
+            return
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump((CACHE_VERSION, self.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+        self.has_changes = False
+
+
+class SharedParseCache:
+    # parsed values of files used by several projects in one process, keyed by real path so projects that
+    # include the same shared module parse it only once. Values are kept pickled and every project gets its
+    # own copy, since string files change their values in place
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def _get_key(self, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None, None
+        return os.path.realpath(filepath), (stat.st_size, stat.st_mtime_ns)
+
+    def get(self, filepath):
+        path, signature = self._get_key(filepath)
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != signature:
+                return None
+            self.hits += 1
+        return pickle.loads(entry[1])
+
+    def put(self, filepath, values):
+        path, signature = self._get_key(filepath)
+        if path is None:
+            return
+        data = pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self.entries[path] = (signature, data)
+
+    def get_view(self, cache=None):
+        return SharedParseCacheView(self, cache)
+
+
+class SharedParseCacheView:
+    # the ParseCache interface for one project: the shared cache first, then the project's own cache file
+
+    def __init__(self, shared_cache, cache=None):
+        self.shared_cache = shared_cache
+        self.cache = cache
+
+    def get(self, filepath):
+        values = self.shared_cache.get(filepath)
+        if values is None and self.cache:
+            values = self.cache.get(filepath)
+            if values is not None:
+                self.shared_cache.put(filepath, values)
+        return values
+
+    def put(self, filepath, values):
+        self.shared_cache.put(filepath, values)
+        if self.cache:
+            self.cache.put(filepath, values)
+
+    def save(self):
+        if self.cache:
+            self.cache.save()
+
+
+class SheetRowHashes:
+    # hashes of the sheet rows applied by the last fetch, only trusted while the index file is the one they were applied to
+
+    def __init__(self, path, index_path):
+        self.path = path
+        self.index_path = index_path
+        self.hashes = {}
+        self._read_from_file()
+
+    def _get_index_fingerprint(self):
+        if not os.path.exists(self.index_path):
+            return None
+        stat = os.stat(self.index_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _read_from_file(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                version, index_fingerprint, hashes = pickle.load(f)
+        except Exception as e:
+            echo(f"!!! ignoring unreadable sheet cache {self.path}: {e}")
+            return
+        if version == CACHE_VERSION and index_fingerprint == self._get_index_fingerprint():
+            self.hashes = hashes
+
+    def save(self):
+        # call once the index has been written so its fingerprint is current
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump((CACHE_VERSION, self._get_index_fingerprint(), self.hashes), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
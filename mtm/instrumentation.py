@@ -0,0 +1,126 @@
+import cProfile
+import threading
+import time
+from contextlib import nullcontext
+
+# everything here is a no-op until enable() is called, so call sites can stay in the hot paths
+_NULL_PHASE = nullcontext()
+
+
+class Stats:
+
+    def __init__(self):
+        self.enabled = False
+        self.timings = {}
+        self.counters = {}
+        self.hooks = []
+        self.profiler = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.timings = {}
+            self.counters = {}
+
+    def record_phase(self, name, elapsed):
+        with self._lock:
+            total, calls = self.timings.get(name, (0.0, 0))
+            self.timings[name] = (total + elapsed, calls + 1)
+        for hook in self.hooks:
+            hook("phase", name, elapsed)
+
+    def record_count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook("count", name, value)
+
+    def record_gauge(self, name, value):
+        with self._lock:
+            self.counters[name] = value
+        for hook in self.hooks:
+            hook("gauge", name, value)
+
+
+class _Phase:
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        stats.record_phase(self.name, time.perf_counter() - self.start)
+        return False
+
+
+stats = Stats()
+
+
+def enable(profile=False):
+    stats.enabled = True
+    if profile and stats.profiler is None:
+        stats.profiler = cProfile.Profile()
+        stats.profiler.enable()
+
+
+def disable():
+    stats.enabled = False
+    if stats.profiler is not None:
+        stats.profiler.disable()
+
+
+def add_hook(hook):
+    # hook(kind, name, value) is called for every phase ("phase"), counter ("count") and gauge ("gauge") while enabled
+    stats.hooks.append(hook)
+
+
+def remove_hook(hook):
+    stats.hooks.remove(hook)
+
+
+def phase(name):
+    if not stats.enabled:
+        return _NULL_PHASE
+    return _Phase(name)
+
+
+def count(name, value=1):
+    if stats.enabled:
+        stats.record_count(name, value)
+
+
+def gauge(name, value):
+    if stats.enabled:
+        stats.record_gauge(name, value)
+
+
+def get_report():
+    return {
+        "phases": {
+            name: {"seconds": total, "calls": calls}
+            for name, (total, calls) in sorted(stats.timings.items())
+        },
+        "counters": dict(sorted(stats.counters.items())),
+    }
+
+
+def format_report():
+    report = get_report()
+    lines = ["phase                             seconds   calls"]
+    for name, timing in report["phases"].items():
+        lines.append(f'{name:30}{timing["seconds"]:10.3f}{timing["calls"]:8}')
+    lines.append("")
+    lines.append("counter                             value")
+    for name, value in report["counters"].items():
+        lines.append(f'{name:30}{value:12}')
+    return "\n".join(lines)
+
+
+def dump_profile(path):
+    if stats.profiler is None:
+        raise Exception("profiling was not enabled")
+    stats.profiler.dump_stats(path)
@@ -1,85 +1,128 @@
+import codecs
 import os
-from re import compile
+from re import compile, DOTALL
 from .strings import STRING_TYPE, StringFile, StringItem
 
-re_translation = compile(r'^"(.*)" = "(.*)";$')
-re_comment_single = compile(r'^/\*.*\*/$')
-re_comment_start = compile(r'^/\*.*$')
-re_comment_end = compile(r'^.*\*/$')
+# comments and whitespace allowed between the tokens of an entry
+GAP = r'(?:\s|/\*.*?\*/|//[^\n]*)*'
+TOKEN = r'(?:"(?P<quoted_{0}>[^"\\]*(?:\\.[^"\\]*)*)"|(?P<{0}>[^\s=;"/]+))'
+
+# a single entry per match; quoted strings keep their escapes as-is
+re_entry = compile(
+    r'\s*(?P<comments>(?:(?:/\*.*?\*/|//[^\n]*)\s*)*)'
+    + TOKEN.format('key') + GAP + '=' + GAP + TOKEN.format('value') + GAP + ';',
+    DOTALL
+)
+re_comment = compile(r'/\*.*?\*/|//[^\n]*', DOTALL)
+re_trailing = compile(GAP + r'\Z', DOTALL)
+# a backslash pair is skipped as a whole, so only quotes that are not escaped yet match on their own
+re_quote = compile(r'(\\.)|"', DOTALL)
+re_escape = compile(r'\\(.)', DOTALL)
+
+
+def read_strings_text(filepath):
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return data.decode('utf-16')
+    return data.decode('utf-8-sig')
+
+
+def escape_value(value):
+    # values are kept with their .strings escapes, so only bare quotes need escaping
+    return re_quote.sub(lambda match: match.group(1) or '\\"', value)
+
+
+def unescape_value(value):
+    # undoes escape_value, and \' which .strings files allow but never need; other escapes like \n are kept
+    if not value or '\\' not in value:
+        return value
+    return re_escape.sub(lambda match: match.group(1) if match.group(1) in '"\'' else match.group(0), value)
+
+
+def get_comments(comments):
+    # the usual single /* */ comment is taken as is, anything else is split into its comments
+    comments = comments.rstrip()
+    if comments.endswith('*/') and comments.find('/*', 2) == -1 and '//' not in comments:
+        return (f'{comments}\n',)
+    return tuple(f'{comment}\n' for comment in re_comment.findall(comments))
+
+
+def parse_strings_text(text, filepath=None):
+    string_items = []
+    # files repeat the same comment a lot, "No comment provided by engineer." above most entries, so each
+    # distinct comment block is split once and its tuple shared
+    comment_tuples = {'': ()}
+    position = 0
+    for match in iter(re_entry.scanner(text).match, None):
+        comments, quoted_key, key, value, bare_value = match.groups()
+        if value is None:
+            value = bare_value
+        elif '\\' in value:
+            value = unescape_value(value)
+        comment_tuple = comment_tuples.get(comments)
+        if comment_tuple is None:
+            comment_tuple = comment_tuples[comments] = get_comments(comments)
+        string_items.append(StringItem(
+            quoted_key if quoted_key is not None else key,
+            STRING_TYPE,
+            value=value,
+            comments=comment_tuple
+        ))
+        position = match.end()
+
+    if not re_trailing.match(text, position):
+        position += len(text[position:]) - len(text[position:].lstrip())
+        line = text.count('\n', 0, position) + 1
+        raise Exception(f'invalid strings entry on line {line}: {text[position:position + 40]!r}\npath: {filepath}')
+    return string_items
 
 
 class iOSStringFile(StringFile):
+    platform = "ios"
     
     @property
     def header(self):
         return ""
 
-    @property
-    def body(self):
-        body_string = ""
-        sorted_values = sorted(self.values, key=lambda x: x.key.lower())
+    def iter_body(self):
         is_first = True
-        for value in sorted_values:
-            comments = "/* No comment provided by engineer. */"
+        for value in self.sorted_values:
+            comments = "/* No comment provided by engineer. */\n"
             if len(value.comments) > 0:
-                comments = ""
-                for comment in value.comments:
-                    comments += f'{comment}'
+                comments = "".join(value.comments)
 
             # if blank we need to get the default value from the default language file and set this field
+            string_value = escape_value(value.value if value.value else value.key)
             if is_first:
                 is_first = False
-                body_string += f'{comments}"{value.key}" = "{value.value if value.value else value.key}";\n'
+                yield f'{comments}"{escape_value(value.key)}" = "{string_value}";\n'
             else:
-                body_string += f'\n{comments}"{value.key}" = "{value.value if value.value else value.key}";\n'
-        return body_string
+                yield f'\n{comments}"{escape_value(value.key)}" = "{string_value}";\n'
 
     @property
     def footer(self):
         return ""
 
+    def adapt_placeholder(self, placeholder):
+        # objects are formatted with %@ on iOS
+        return f'{placeholder[:-1]}@' if placeholder.endswith('s') else placeholder
+
     def parse(self):
-        string_items = []
-        with open(self.filepath, 'r') as f:
-            line = f.readline()
-            while line:
-                comments = [line]
-                if not re_comment_single.match(line):
-                    while line and not re_comment_end.match(line):
-                        line = f.readline()
-                        comments.append(line)
-                
-                line = f.readline()
-                if line and re_translation.match(line):
-                    translation = line
-                else:
-                    continue
-                
-                line = f.readline()
-                while line and line == u'\n':
-                    line = f.readline()
-
-                key, value = re_translation.match(translation).groups()
-                string_items.append(
-                    StringItem(
-                        key,
-                        STRING_TYPE,
-                        value=value,
-                        comments=comments
-                    )
-                )
-
-        return string_items
+        return parse_strings_text(read_strings_text(self.filepath), self.filepath)
 
     @staticmethod
-    def get_string_files(config):
-        string_files = []
-        for string_dir in config.string_dirs:
-            for language in config.languages:
-                path = os.path.normpath(f'{config.project_dir}/{string_dir}/{language}.lproj/{config.strings_filename}')
-                string_files.append(iOSStringFile(path, language, default=language == config.default_language))
-        return string_files
+    def get_string_dir_args(config, string_dir):
+        string_file_args = []
+        for language in config.languages:
+            path = os.path.normpath(f'{config.project_dir}/{string_dir}/{language}.lproj/{config.strings_filename}')
+            string_file_args.append((path, language, language == config.default_language))
+        return string_file_args
+
+    @staticmethod
+    def get_string_file_args(config):
+        return [args for string_dir in config.string_dirs for args in iOSStringFile.get_string_dir_args(config, string_dir)]
 
     @staticmethod
-    def popuplate_with_new_keys(config):
-        pass
+    def get_string_files(config):
+        return [iOSStringFile(*args) for args in iOSStringFile.get_string_file_args(config)]
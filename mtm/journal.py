@@ -0,0 +1,272 @@
+import glob
+import json
+import os
+import time
+
+from .map import StringKey, string_index_from_dict, string_index_to_dict, strings_map_from_dict, strings_map_to_dict
+from .output import echo
+from .writer import write_file
+
+# a snapshot is taken once this many records were committed since the last one
+SNAPSHOT_RECORDS = 100000
+KEEP_SNAPSHOTS = 10
+RETENTION_DAYS = 90
+TAIL_SIZE = 1 << 16
+
+
+class Journal:
+    # append-only log of every change made to the index, one json object per line. Records of a session are
+    # buffered and appended together, ended by a commit line, so a torn write never replays half a commit.
+    # Snapshots of the whole index are only taken every SNAPSHOT_RECORDS records, a restore loads the newest
+    # snapshot at or before its target and replays the commits after it
+
+    def __init__(self, index_path, snapshot_records=SNAPSHOT_RECORDS, keep_snapshots=KEEP_SNAPSHOTS, retention_days=RETENTION_DAYS, fsync=False):
+        self.path = f"{index_path}.journal"
+        self.snapshot_prefix = f"{index_path}.snapshot."
+        self.snapshot_records = snapshot_records
+        self.keep_snapshots = keep_snapshots
+        self.retention_days = retention_days
+        self.fsync = fsync
+        # where the changes being recorded come from, e.g. "files" or "sheet"
+        self.source = None
+        self.records = []
+        self._last_commit = None
+
+    def record_index(self, string_index):
+        self.records.append({"op": "index", "source": self.source, "value": string_index.value, "index": string_index_to_dict(string_index)})
+
+    def record_key(self, string_index, string_key):
+        self.records.append({
+            "op": "key",
+            "source": self.source,
+            "value": string_index.value,
+            "key": string_key.key,
+            "placeholder_map": dict(string_key.placeholder_map),
+            "platform": string_key.platform,
+        })
+
+    def record_translation(self, string_index, language, old_translation):
+        translation = string_index.translations.get(language)
+        if translation != old_translation:
+            self.records.append({
+                "op": "translation",
+                "source": self.source,
+                "value": string_index.value,
+                "language": language,
+                "old": old_translation,
+                "new": translation,
+            })
+
+    def _read_lines(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # a line torn by a crash, its commit line was never written
+                    continue
+
+    def get_last_commit(self):
+        # only the tail of the journal is read, commits are small
+        if self._last_commit is None and os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(self.path) - TAIL_SIZE))
+                lines = f.read().decode('utf-8', errors='ignore').splitlines()
+            for line in reversed(lines):
+                if '"op": "commit"' in line:
+                    try:
+                        self._last_commit = json.loads(line)
+                        break
+                    except ValueError:
+                        continue
+            else:
+                commits = self.get_commits()
+                self._last_commit = commits[-1] if commits else None
+        if self._last_commit is None:
+            # every commit was compacted away, numbering carries on from the newest snapshot
+            snapshots = self.get_snapshots()
+            if snapshots:
+                self._last_commit = {"op": "commit", "commit": snapshots[-1][0], "pending": 0}
+        return self._last_commit
+
+    def get_commits(self):
+        return [line for line in self._read_lines() if line.get("op") == "commit"]
+
+    def get_snapshots(self):
+        # [(commit, path)] oldest first
+        snapshots = []
+        for path in glob.glob(f"{glob.escape(self.snapshot_prefix)}*.json"):
+            commit = path[len(self.snapshot_prefix):-len(".json")]
+            if commit.isdigit():
+                snapshots.append((int(commit), path))
+        return sorted(snapshots)
+
+    def _append(self, records, **attributes):
+        last_commit = self.get_last_commit()
+        commit = last_commit["commit"] + 1 if last_commit else 1
+        snapshots = self.get_snapshots()
+        pending = 0
+        if last_commit and (not snapshots or snapshots[-1][0] < last_commit["commit"]):
+            pending = last_commit.get("pending", 0)
+        commit_line = {"op": "commit", "commit": commit, "time": time.time(), "records": len(records), "pending": pending + len(records), **attributes}
+        lines = [json.dumps({"commit": commit, **record}, ensure_ascii=False) for record in records]
+        lines.append(json.dumps(commit_line, ensure_ascii=False))
+        data = "".join(f"{line}\n" for line in lines).encode('utf-8')
+        with open(self.path, 'ab+') as f:
+            # records after the last commit line were appended by a run that never committed them, they would
+            # otherwise carry this commit's number and be replayed with it
+            end = self._get_commit_end(f)
+            if end < f.seek(0, os.SEEK_END):
+                f.truncate(end)
+            # a torn last line must not swallow the first record of this commit
+            if end > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._last_commit = commit_line
+        return commit_line
+
+    def _get_commit_end(self, f):
+        # the offset right after the last commit line, read backwards from the end a chunk at a time
+        chunk_end = f.seek(0, os.SEEK_END)
+        tail = b""
+        while chunk_end > 0:
+            chunk_start = max(0, chunk_end - TAIL_SIZE)
+            f.seek(chunk_start)
+            tail = f.read(chunk_end - chunk_start) + tail
+            chunk_end = chunk_start
+            search_end = len(tail)
+            while True:
+                position = tail.rfind(b'"op": "commit"', 0, search_end)
+                line_start = tail.rfind(b"\n", 0, position) + 1
+                if position < 0 or (line_start == 0 and chunk_start > 0):
+                    # the line may start in the previous chunk
+                    break
+                line_end = tail.find(b"\n", position)
+                line_end = len(tail) if line_end < 0 else line_end + 1
+                try:
+                    if json.loads(tail[line_start:line_end]).get("op") == "commit":
+                        return chunk_start + line_end
+                except ValueError:
+                    pass
+                search_end = line_start
+        return 0
+
+    def commit(self, strings_map=None):
+        # appends the recorded changes, called before the index itself is written; returns the commit or None
+        if not self.records:
+            return None
+        records = self.records
+        self.records = []
+        commit_line = self._append(records)
+        if strings_map is not None and commit_line["pending"] >= self.snapshot_records:
+            self.snapshot(strings_map)
+        return commit_line["commit"]
+
+    def checkpoint(self, strings_map, reason):
+        # a commit without records followed by a snapshot, for changes that replace the whole index
+        self.records = []
+        self._append([], reason=reason)
+        self.snapshot(strings_map)
+
+    def start(self, strings_map):
+        # an index without any snapshot, e.g. one created before the journal, gets its first one here
+        if not self.get_snapshots():
+            echo("creating first journal snapshot")
+            self.checkpoint(strings_map, "start")
+
+    def snapshot(self, strings_map):
+        last_commit = self.get_last_commit()
+        commit = last_commit["commit"] if last_commit else 0
+        data = {"commit": commit, "time": time.time(), **strings_map_to_dict(strings_map)}
+        write_file(f"{self.snapshot_prefix}{commit}.json", lambda f: json.dump(data, f, ensure_ascii=False), self.fsync, stream=True)
+        self.apply_retention()
+
+    def apply_retention(self):
+        # keeps the newest keep_snapshots snapshots that are not older than retention_days, the newest one always,
+        # and drops the commits before the oldest kept snapshot since nothing can be restored from them
+        snapshots = self.get_snapshots()
+        if not snapshots:
+            return
+        oldest_time = time.time() - self.retention_days * 24 * 60 * 60
+        kept = [
+            (commit, path) for commit, path in snapshots[-self.keep_snapshots:]
+            if os.path.getmtime(path) >= oldest_time
+        ] or snapshots[-1:]
+        for commit, path in snapshots:
+            if (commit, path) not in kept:
+                os.remove(path)
+        oldest_commit = kept[0][0]
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            first_line = f.readline()
+        try:
+            if json.loads(first_line).get("commit", 0) >= oldest_commit:
+                return
+        except ValueError:
+            pass
+        lines = [json.dumps(line, ensure_ascii=False) for line in self._read_lines() if line.get("commit", 0) >= oldest_commit]
+        write_file(self.path, lambda f: f.write("".join(f"{line}\n" for line in lines)), self.fsync)
+
+    def get_commit_at(self, timestamp):
+        # the last commit made at or before timestamp
+        commits = [commit for commit in self.get_commits() if commit["time"] <= timestamp]
+        if not commits:
+            raise Exception(f"the journal has no commit before {timestamp}")
+        return commits[-1]["commit"]
+
+    def restore(self, commit=None):
+        # the index as it was right after commit, the latest one when not given
+        if commit is None:
+            last_commit = self.get_last_commit()
+            commit = last_commit["commit"] if last_commit else 0
+        snapshots = [(snapshot_commit, path) for snapshot_commit, path in self.get_snapshots() if snapshot_commit <= commit]
+        if not snapshots:
+            raise Exception(f"no snapshot to restore commit {commit} from, the journal only goes back to its oldest snapshot")
+        snapshot_commit, path = snapshots[-1]
+        with open(path, 'r', encoding='utf-8') as f:
+            strings_map = strings_map_from_dict(json.load(f))
+
+        records = []
+        for line in self._read_lines():
+            line_commit = line.get("commit", 0)
+            if line_commit <= snapshot_commit:
+                continue
+            if line_commit > commit:
+                break
+            if line.get("op") == "commit":
+                # a commit's records are written right before its line, earlier records with its number were
+                # left by an append that never committed
+                for record in records[max(0, len(records) - line.get("records", len(records))):]:
+                    apply_record(strings_map, record)
+                records = []
+            else:
+                records.append(line)
+        return strings_map
+
+
+def apply_record(strings_map, record):
+    op = record["op"]
+    if op == "index":
+        if record["value"] not in strings_map.index:
+            strings_map.add_index(string_index_from_dict(record["index"]))
+    elif op == "key":
+        strings_map.add_key(
+            strings_map.index[record["value"]],
+            StringKey(
+                record["key"],
+                {int(index): placeholder for index, placeholder in record["placeholder_map"].items()},
+                record.get("platform")
+            )
+        )
+    elif op == "translation":
+        strings_map.set_translation(record["value"], record["language"], record["new"])
+    else:
+        raise Exception(f"{op} is not a supported journal record")
@@ -0,0 +1,179 @@
+from .strings import PLURAL_TYPE, re_template_placeholder
+
+ERROR = "error"
+WARNING = "warning"
+
+# check -> severity; placeholder mistakes crash the app at runtime, everything else falls back to a default
+CHECKS = {
+    "placeholder_count": ERROR,
+    "placeholder_order": ERROR,
+    "missing_plural": WARNING,
+    "untranslated": WARNING,
+    "fuzzy": WARNING,
+    "orphan_key": WARNING,
+}
+
+
+class LintIssue:
+    __slots__ = ('check', 'value', 'languages', 'keys', 'filepath', 'message')
+
+    def __init__(self, check, message, value=None, languages=(), keys=(), filepath=None):
+        self.check = check
+        self.message = message
+        self.value = value
+        self.languages = list(languages)
+        self.keys = list(keys)
+        self.filepath = filepath
+
+    @property
+    def severity(self):
+        return CHECKS[self.check]
+
+    def to_dict(self):
+        return {
+            "check": self.check,
+            "severity": self.severity,
+            "message": self.message,
+            "value": self.value,
+            "languages": self.languages,
+            "keys": self.keys,
+            "filepath": self.filepath,
+        }
+
+    def __str__(self):
+        location = self.filepath if self.filepath else ",".join(self.keys)
+        languages = f' [{",".join(self.languages)}]' if self.languages else ""
+        return f"{self.severity}: {self.check} {location}{languages}: {self.message}"
+
+
+def _is_positional(string_index):
+    # "%1$s %2$d" can be reordered by a translation, "%s %d" can not
+    return all(
+        '$' in placeholder or placeholder == '%%'
+        for string_key in string_index.keys
+        for placeholder in string_key.placeholder_map.values()
+    )
+
+
+def lint_index(strings_map, languages):
+    # one pass over the index comparing every translation with the placeholder signature of its value
+    issues = []
+    for string_index in strings_map.index.values():
+        if not string_index.translatable:
+            continue
+        signature = string_index.placeholder_signature
+        sorted_signature = sorted(signature) if len(signature) > 1 else signature
+        translations = string_index.translations
+        conflicts = string_index.conflicts
+        untranslated = []
+        fuzzy = []
+        for language in languages:
+            translation = translations.get(language)
+            # propagated keys hold the source value until translated, the sheet shows those cells blank too
+            if not translation or translation == string_index.value:
+                untranslated.append(language)
+                continue
+            if conflicts and language in conflicts:
+                fuzzy.append(language)
+                continue
+            if not signature and '{' not in translation:
+                continue
+            translation_signature = tuple(map(int, re_template_placeholder.findall(translation)))
+            if translation_signature == signature:
+                continue
+            if (sorted(translation_signature) if len(translation_signature) > 1 else translation_signature) != sorted_signature:
+                issues.append(LintIssue(
+                    "placeholder_count",
+                    f"expected placeholders {list(signature)}, translation has {list(translation_signature)}",
+                    string_index.value, [language], [string_key.key for string_key in string_index.keys]
+                ))
+            elif not _is_positional(string_index):
+                issues.append(LintIssue(
+                    "placeholder_order",
+                    f"placeholders reordered to {list(translation_signature)} but they are not numbered",
+                    string_index.value, [language], [string_key.key for string_key in string_index.keys]
+                ))
+        if untranslated and string_index.value:
+            issues.append(LintIssue(
+                "untranslated", f"{len(untranslated)} languages without a translation",
+                string_index.value, untranslated, [string_key.key for string_key in string_index.keys]
+            ))
+        if fuzzy:
+            issues.append(LintIssue(
+                "fuzzy", "conflicting translations need resolving",
+                string_index.value, fuzzy, [string_key.key for string_key in string_index.keys]
+            ))
+    return issues
+
+
+def lint_files(string_dir_groups, strings_map):
+    # string_dir_groups holds the loaded files of each string dir; plurals are not in the index, so they
+    # and the keys of the files are checked against each string dir's default file
+    issues = []
+    default_keys = set()
+    for string_files in string_dir_groups:
+        default_file = next((string_file for string_file in string_files if string_file.default), None)
+        if default_file is None:
+            continue
+        default_keys.update(default_file.keys)
+        default_plurals = {
+            value.key for value in default_file.values
+            if value.type == PLURAL_TYPE and value.translatable
+        }
+        for string_file in string_files:
+            if string_file is default_file:
+                continue
+            plurals = {value.key: value for value in string_file.values if value.type == PLURAL_TYPE}
+            missing_plurals = sorted(default_plurals - plurals.keys())
+            if missing_plurals:
+                issues.append(LintIssue(
+                    "missing_plural", f"{len(missing_plurals)} plurals of the default file are missing",
+                    languages=[string_file.language], keys=missing_plurals, filepath=string_file.filepath
+                ))
+            for key in sorted(default_plurals & plurals.keys()):
+                if not any(item.quantity == "other" for item in plurals[key].plural_items or ()):
+                    issues.append(LintIssue(
+                        "missing_plural", "plural has no \"other\" quantity",
+                        languages=[string_file.language], keys=[key], filepath=string_file.filepath
+                    ))
+            orphan_keys = sorted(string_file.keys - default_file.keys)
+            if orphan_keys:
+                issues.append(LintIssue(
+                    "orphan_key", f"{len(orphan_keys)} keys are not in the default file",
+                    languages=[string_file.language], keys=orphan_keys, filepath=string_file.filepath
+                ))
+
+    for string_index in strings_map.index.values():
+        orphan_keys = [string_key.key for string_key in string_index.keys if string_key.key not in default_keys]
+        if orphan_keys:
+            issues.append(LintIssue(
+                "orphan_key", "keys in the index are not in any default file", string_index.value, keys=orphan_keys
+            ))
+    return issues
+
+
+def get_summary(issues):
+    summary = {check: 0 for check in CHECKS}
+    for issue in issues:
+        summary[issue.check] += 1
+    return summary
+
+
+def get_report(issues):
+    summary = get_summary(issues)
+    return {
+        "errors": sum(count for check, count in summary.items() if CHECKS[check] == ERROR),
+        "warnings": sum(count for check, count in summary.items() if CHECKS[check] == WARNING),
+        "summary": summary,
+        "issues": [issue.to_dict() for issue in issues],
+    }
+
+
+def format_report(issues):
+    lines = [str(issue) for issue in issues]
+    report = get_report(issues)
+    lines.append("")
+    for check, count in report["summary"].items():
+        lines.append(f"{check:24}{count:8}")
+    lines.append(f'{report["errors"]} errors, {report["warnings"]} warnings')
+    return "\n".join(lines)
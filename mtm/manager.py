@@ -2,28 +2,42 @@ from datetime import datetime
 import os
 import shutil
 import json
+import time
 from .sheets import fetch_from_google_sheet, upload_to_google_sheet
-from .android import AndroidStringFile
-from munch import Munch
+from . import instrumentation
+from .cache import ParseCache, SheetRowHashes
+from .journal import KEEP_SNAPSHOTS, RETENTION_DAYS, SNAPSHOT_RECORDS, Journal
 
-from .ios import iOSStringFile
-from .map import StringsMap, StringsMapSchema
-from .utilities import get_generic_language
+from .map import INDEX_VERSION, StringsMap
+from .output import echo
+from .storage import JsonStorage, SqliteStorage, get_storage
+from .strings import propagate_keys
+from .utilities import AttributeDict, get_generic_language
+from .writer import FileWriter
 
 
 DEFAULT_CONFIG_PATH = "config.json"
 
 
-def get_config(config_path=DEFAULT_CONFIG_PATH):
-    with open(config_path, 'r') as f:
-        config_data = f.read()
-    return Munch.fromDict(json.loads(config_data))
+def get_config(config_path=DEFAULT_CONFIG_PATH, relative_to_config=False):
+    # paths in the config are relative to the working directory, or to the config's own directory when
+    # relative_to_config is set so several projects can run in one process
+    with instrumentation.phase("config.load"):
+        with open(config_path, 'r') as f:
+            config_data = f.read()
+        config = json.loads(config_data, object_hook=AttributeDict)
+        if relative_to_config:
+            directory = os.path.dirname(os.path.abspath(config_path))
+            config.string_index_filename = os.path.join(directory, config.string_index_filename)
+            for application in config.applications:
+                application.project_dir = os.path.join(directory, application.project_dir)
+        return config
 
 
 def _get_generic_languages(config, exclude_default=False):
     languages = []
     for application in config.applications:
-        application_languages = application.languages
+        application_languages = list(application.languages)
         if exclude_default:
             application_languages.remove(application.default_language)
         languages.extend(application_languages)
@@ -31,94 +45,640 @@ def _get_generic_languages(config, exclude_default=False):
     return sorted(languages)
 
 
-def _get_string_files(config):
+def _get_string_file_class(platform):
+    # platform modules are imported on demand so an ios only project never loads the xml stack
+    if platform == "ios":
+        from .ios import iOSStringFile
+        return iOSStringFile
+    elif platform == "android":
+        from .android import AndroidStringFile
+        return AndroidStringFile
+    else:
+        raise Exception(f"{platform} is not a supported platform")
+
+
+def _load_string_file(string_file_class, filepath, language, default):
+    with instrumentation.phase(f"parse.{string_file_class.platform}"):
+        string_file = string_file_class(filepath, language, default)
+    instrumentation.count("files.parsed")
+    return string_file
+
+
+def _get_executor(workers, executor_type):
+    if executor_type == "process":
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=workers)
+    elif executor_type == "thread":
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=workers)
+    else:
+        raise Exception(f"{executor_type} is not a supported executor")
+
+
+def _load_string_files(jobs, workers=1, executor_type="thread", cache=None):
+    # files are returned in job order no matter which worker finishes first
+    results = {}
+    pending_jobs = []
+    for job in jobs:
+        string_file_class, filepath, language, default = job
+        values = cache.get(filepath) if cache else None
+        if values is not None:
+            results[job] = (None, string_file_class(filepath, language, default, values=values))
+            instrumentation.count("files.cached")
+        else:
+            pending_jobs.append(job)
+
+    if workers > 1 and len(pending_jobs) > 1:
+        with _get_executor(workers, executor_type) as executor:
+            futures = [executor.submit(_load_string_file, *job) for job in pending_jobs]
+            for job, future in zip(pending_jobs, futures):
+                error = future.exception()
+                results[job] = (error, None if error else future.result())
+    else:
+        for job in pending_jobs:
+            try:
+                results[job] = (None, _load_string_file(*job))
+            except Exception as e:
+                results[job] = (e, None)
+
     string_files = []
-    for application in config.applications:
-        platform = application.platform
-        if platform == "ios":
-            string_files.extend(iOSStringFile.get_string_files(application))
-        elif platform == "android":
-            string_files.extend(AndroidStringFile.get_string_files(application))
+    parsed_jobs = set(pending_jobs)
+    for job in jobs:
+        error, string_file = results[job]
+        if error:
+            echo(f"!!! unable to load {job[1]}: {error}")
         else:
-            raise Exception(f"{platform} is not a supported platform")
+            string_files.append(string_file)
+            if cache and job in parsed_jobs:
+                cache.put(string_file.filepath, string_file.values)
+    if len(string_files) != len(jobs):
+        echo(f"!!! skipped {len(jobs) - len(string_files)} of {len(jobs)} string files")
+    if cache:
+        cache.save()
     return string_files
 
 
-def populate_with_new_keys(config_path=DEFAULT_CONFIG_PATH):
-    config = get_config(config_path)
+def _get_parse_cache(config):
+    # off unless "parse_cache": true, so projects do not grow a cache file next to the index by surprise
+    if not config.get("parse_cache", False):
+        return None
+    return ParseCache(f"{config.string_index_filename}.cache")
+
+
+def _get_string_file_jobs(config):
+    jobs = []
     for application in config.applications:
-        platform = application.platform
-        if platform == "android":
-            AndroidStringFile.populate_with_new_keys(application)
-        elif platform == "ios":
-            iOSStringFile.popuplate_with_new_keys(application)
+        string_file_class = _get_string_file_class(application.platform)
+        jobs.extend((string_file_class, *args) for args in string_file_class.get_string_file_args(application))
+    return jobs
+
+
+def _get_string_files(config, cache=None):
+    cache = cache if cache is not None else _get_parse_cache(config)
+    return _load_string_files(_get_string_file_jobs(config), config.get("workers", 1), config.get("executor", "thread"), cache)
+
+
+def _use_partial_maps(config):
+    # threads share one interpreter, only worker processes can map string dirs in parallel
+    return config.get("workers", 1) > 1 and config.get("executor", "thread") == "process"
+
+
+def _get_string_dir_jobs(config):
+    # one list of jobs per string dir, its default file and translations together
+    groups = []
+    for application in config.applications:
+        string_file_class = _get_string_file_class(application.platform)
+        for string_dir in application.string_dirs:
+            groups.append([(string_file_class, *args) for args in string_file_class.get_string_dir_args(application, string_dir)])
+    return groups
+
+
+def _get_string_dir_groups(config, string_files):
+    # the loaded string files of each string dir, default file included
+    string_files = {string_file.filepath: string_file for string_file in string_files}
+    return [
+        [string_files[path] for _, path, _, _ in jobs if path in string_files]
+        for jobs in _get_string_dir_jobs(config)
+    ]
+
+
+def _build_partial_map(jobs, languages, keep_files=True):
+    # runs in a worker, when the files are not kept only the partial map travels back to the parent
+    string_files = []
+    errors = []
+    for job in jobs:
+        try:
+            string_files.append(_load_string_file(*job))
+        except Exception as e:
+            errors.append((job[1], str(e)))
+    partial = StringsMap.from_files(string_files, languages)
+    return (string_files if keep_files else []), partial, errors
+
+
+def _load_partial_maps(config, languages, keep_files=True, cache=None):
+    # every string dir is parsed and mapped in a worker process; returns the string files (when kept) and
+    # the partial maps, both in config order so merging them gives the same map as a sequential build
+    groups = _get_string_dir_jobs(config)
+    results = [None] * len(groups)
+    pending_groups = []
+    for position, jobs in enumerate(groups):
+        cached_values = [cache.get(job[1]) for job in jobs] if cache else []
+        if cache and all(values is not None for values in cached_values):
+            string_files = [
+                string_file_class(filepath, language, default, values=values)
+                for (string_file_class, filepath, language, default), values in zip(jobs, cached_values)
+            ]
+            results[position] = (string_files, StringsMap.from_files(string_files, languages), [])
+            instrumentation.count("files.cached", len(string_files))
+        else:
+            pending_groups.append(position)
+
+    if pending_groups:
+        with _get_executor(config.get("workers", 1), "process") as executor:
+            futures = [executor.submit(_build_partial_map, groups[position], languages, keep_files) for position in pending_groups]
+            for position, future in zip(pending_groups, futures):
+                results[position] = future.result()
+
+    string_files = []
+    partial_maps = []
+    parsed_groups = set(pending_groups)
+    skipped = 0
+    for position, (group_files, partial_map, errors) in enumerate(results):
+        for filepath, error in errors:
+            echo(f"!!! unable to load {filepath}: {error}")
+        skipped += len(errors)
+        string_files.extend(group_files)
+        partial_maps.append(partial_map)
+        if cache and position in parsed_groups:
+            for string_file in group_files:
+                cache.put(string_file.filepath, string_file.values)
+    if skipped:
+        echo(f"!!! skipped {skipped} of {sum(len(jobs) for jobs in groups)} string files")
+    if cache:
+        cache.save()
+    return string_files, partial_maps
+
+
+def _merge_partial_maps(map, partial_maps):
+    for partial_map in partial_maps:
+        map.merge(partial_map)
+    map.apply_pending()
+    return map
+
+
+def _get_journal(config):
+    # off unless "journal" is true or a dict of options, every sync then makes a full .bak copy of the index
+    journal_config = config.get("journal", False)
+    if journal_config is False or journal_config is None:
+        return None
+    journal_config = journal_config if isinstance(journal_config, dict) else {}
+    return Journal(
+        config.string_index_filename,
+        journal_config.get("snapshot_records", SNAPSHOT_RECORDS),
+        journal_config.get("keep_snapshots", KEEP_SNAPSHOTS),
+        journal_config.get("retention_days", RETENTION_DAYS),
+        config.get("fsync", False)
+    )
+
+
+def _get_translation_memory_config(config):
+    # off unless "translation_memory" is true or {"prefill": bool, "threshold": float}, so projects do not grow
+    # a .tm file next to the index by surprise
+    tm_config = config.get("translation_memory", False)
+    if tm_config is False or tm_config is None:
+        return None
+    return tm_config if isinstance(tm_config, dict) else {}
+
+
+def _get_translation_memory(config):
+    # kept in memory only while the translation memory is turned off
+    from .translation_memory import TranslationMemory
+    if _get_translation_memory_config(config) is None:
+        return TranslationMemory()
+    return TranslationMemory(f"{config.string_index_filename}.tm")
+
+
+def _upgrade_index(config, map):
+    # indexes written by an older release are brought to the current format, see mtm.migrations
+    if map.version == INDEX_VERSION:
+        return map
+    from .migrations import migrate
+    return migrate(map, {application.platform for application in config.applications})
+
+
+def _load_index(config, storage):
+    return _upgrade_index(config, storage.load())
+
+
+def populate_with_new_keys(config_path=DEFAULT_CONFIG_PATH):
+    Session(config_path).run("populate")
+
+
+class Session:
+    # loads config, index and string files once and runs stages against them in memory
+
+    STAGES = ("sync", "populate", "save", "upload")
+
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH, validate=False, worksheet=None, config=None, parse_cache=None, path_locks=None):
+        self.config = config if config is not None else get_config(config_path)
+        self.storage = get_storage(self.config, validate)
+        # a gspread worksheet or anything shaped like one, opened from the config when not given
+        self.worksheet = worksheet
+        # string files are written through one writer so unchanged files are left alone and fsyncs are batched.
+        # path_locks is shared with other sessions that may write the same files, see mtm.batch
+        self.writer = FileWriter(self.config.get("fsync", False), path_locks)
+        self.sheet_values = None
+        self.has_changes = False
+        # a parse cache to use instead of the one from the config, e.g. one shared between projects
+        self.parse_cache = parse_cache
+        # stage -> seconds of the last run()
+        self.timings = {}
+        self._map = None
+        self._string_files = None
+        self._row_hashes = None
+        self._translation_memory = None
+        self.journal = _get_journal(self.config)
+        # {value: {language: (translation, similar value, similarity)}} from the last sync
+        self.suggestions = {}
+        self._is_map_consistent = True
+
+    @property
+    def map(self):
+        if self._map is None:
+            if not self.storage.exists():
+                raise Exception("The string index file is not created yet. Please call the \"init\" function to initalize the string index.")
+            echo("getting current string index")
+            with instrumentation.phase("index.load"):
+                map = self.storage.load()
+            if map.version != INDEX_VERSION:
+                map = _upgrade_index(self.config, map)
+                # the upgrade is kept even when no stage changes the index
+                self.has_changes = True
+                if self.journal is not None:
+                    self.journal.checkpoint(map, "upgrade")
+            self._map = map
+            self._map.journal = self.journal
+        return self._map
+
+    @property
+    def string_files(self):
+        if self._string_files is None:
+            self._load_files()
+        return self._string_files
+
+    def _load_files(self, map_partially=False):
+        # with map_partially the worker processes also map each string dir, and the partial maps are returned
+        echo("loading string files")
+        with instrumentation.phase("files.load"):
+            if map_partially:
+                self._string_files, partial_maps = _load_partial_maps(
+                    self.config, self.get_generic_languages(), cache=self._get_parse_cache()
+                )
+                return partial_maps
+            self._string_files = _get_string_files(self.config, self._get_parse_cache())
+        return None
+
+    def get_generic_languages(self, exclude_default=False):
+        return _get_generic_languages(self.config, exclude_default)
+
+    def _get_parse_cache(self):
+        return self.parse_cache if self.parse_cache is not None else _get_parse_cache(self.config)
+
+    def backup(self):
+        if self.journal is not None:
+            # changes are journaled as they happen, a full copy is only made for the first snapshot
+            self.journal.start(self.map)
+            return
+        echo("creating backup")
+        string_index_path = os.path.abspath(self.config.string_index_filename)
+        shutil.copyfile(string_index_path, f"{string_index_path}.{datetime.now().strftime('%s')}.bak")
+
+    @property
+    def translation_memory(self):
+        if self._translation_memory is None:
+            self._translation_memory = _get_translation_memory(self.config)
+        return self._translation_memory
+
+    def sync(self):
+        echo("starting sync")
+        map = self.map
+        self.backup()
+        known_values = set(map.index)
+
+        self._is_map_consistent = False
+        echo("syncing string index with project strings")
+        partial_maps = None
+        if self._string_files is None and _use_partial_maps(self.config):
+            # only a sync merges partial maps, so string dirs are mapped in the workers only when a sync is
+            # what loads the files; other stages parse them without mapping
+            partial_maps = self._load_files(map_partially=True)
+        string_files = self.string_files
+        self._set_source("files")
+        with instrumentation.phase("map.build"):
+            if partial_maps is not None:
+                _merge_partial_maps(map, partial_maps)
+            else:
+                map.sync(string_files, self.get_generic_languages())
+        with instrumentation.phase("files.update"):
+            map.update_files(string_files, self.writer)
+            self.writer.flush()
+
+        echo("syncing string index with google sheet")
+        # off unless "sheet_cache": true, like the parse cache
+        if self.config.get("sheet_cache", False):
+            self._row_hashes = SheetRowHashes(f"{self.config.string_index_filename}.sheet", self.config.string_index_filename)
+        self._set_source("sheet")
+        with instrumentation.phase("sheet.fetch"):
+            self.sheet_values = fetch_from_google_sheet(
+                self.config.sheets_api.spreadsheet_id, map, self.worksheet, self._row_hashes.hashes if self._row_hashes else None
+            )
+        self._is_map_consistent = True
+        self.has_changes = True
+        self.suggest_translations([value for value in map.index if value not in known_values])
+
+    def _set_source(self, source):
+        # journaled changes are tagged with the stage that made them
+        if self.journal is not None:
+            self.journal.source = source
+
+    def suggest_translations(self, values):
+        # new values that are still untranslated get the translations of near duplicates already in the index
+        tm_config = _get_translation_memory_config(self.config)
+        if tm_config is None:
+            return
+        from .translation_memory import DEFAULT_THRESHOLD, get_suggestions
+        with instrumentation.phase("tm.update"):
+            self.translation_memory.update(self.map)
+        with instrumentation.phase("tm.suggest"):
+            self.suggestions = get_suggestions(
+                self.map,
+                self.translation_memory,
+                values,
+                self.get_generic_languages(exclude_default=True),
+                tm_config.get("threshold", DEFAULT_THRESHOLD)
+            )
+        prefill = tm_config.get("prefill", False)
+        self._set_source("translation_memory")
+        for value, translations in self.suggestions.items():
+            for language, (translation, similar_value, similarity) in translations.items():
+                echo(f"{'prefilled' if prefill else 'suggestion for'} {value!r} [{language}]: {translation!r} (from {similar_value!r}, {similarity:.0%} similar)")
+                if prefill:
+                    self.map.set_translation(value, language, translation)
+        if self.suggestions:
+            echo(f"{len(self.suggestions)} new strings have translations from similar strings")
+
+    def _populate(self):
+        # keys are propagated between the files already in memory, they are written by the caller
+        with instrumentation.phase("files.populate"):
+            for group in _get_string_dir_groups(self.config, self.string_files):
+                propagate_keys(group)
+
+    def populate(self):
+        # need to make sure project files have the same keys as the default files
+        self._populate()
+        with instrumentation.phase("files.update"):
+            for string_file in self.string_files:
+                if string_file.has_changes:
+                    string_file.update_strings_file(self.writer)
+            self.writer.flush()
+
+    def save(self, string_files=None):
+        # populated files are written together with the index values, so each file is written at most once;
+        # string_files limits the update to those files plus any that gained keys
+        self._populate()
+        map = self.map
+        if string_files is None:
+            string_files = self.string_files
+        else:
+            string_files = [*string_files, *(f for f in self.string_files if f.has_changes and f not in string_files)]
+        with instrumentation.phase("files.update"):
+            map.update_files(string_files, self.writer)
+            self.writer.flush()
+
+    def reload_string_file(self, filepath):
+        # parses one file again and syncs only that file into the map
+        for position, string_file in enumerate(self.string_files):
+            if string_file.filepath == filepath:
+                break
         else:
-            raise Exception(f"{platform} is not a supported platform")
+            raise Exception(f"{filepath} is not a configured string file")
+        string_file = _load_string_file(type(string_file), filepath, string_file.language, string_file.default)
+        self.string_files[position] = string_file
+        self._is_map_consistent = False
+        self._set_source("files")
+        with instrumentation.phase("map.build"):
+            self.map.sync([string_file], self.get_generic_languages())
+        self._is_map_consistent = True
+        self.has_changes = True
+        return string_file
 
+    def reload_map(self):
+        # drops a map that a failed update left half applied along with its journal records, the next use
+        # reads the index again
+        self._map = None
+        self._is_map_consistent = True
+        self.has_changes = False
+        if self.journal is not None:
+            self.journal.records = []
 
-def init(config_path=DEFAULT_CONFIG_PATH):
+    def upload(self):
+        # cells translators change on the sheet after this session's sync are left alone
+        map = self.map
+        with instrumentation.phase("sheet.upload"):
+            upload_to_google_sheet(
+                self.config.sheets_api.spreadsheet_id,
+                map,
+                self.get_generic_languages(exclude_default=True),
+                self.sheet_values,
+                self.worksheet
+            )
+
+    def persist(self):
+        if not self.has_changes:
+            return
+        echo('saving string index')
+        instrumentation.gauge("index.keys", len(self.map.index))
+        instrumentation.gauge("index.conflicts", self.map.conflict_count)
+        if self.journal is not None:
+            # written ahead of the index, so the journal never lags behind it
+            with instrumentation.phase("journal.commit"):
+                self.journal.commit(self.map)
+        with instrumentation.phase("index.dump"):
+            self.storage.save(self.map)
+        if self._row_hashes:
+            self._row_hashes.save()
+        if self._translation_memory is not None:
+            self._translation_memory.save()
+        self.has_changes = False
+
+    def run(self, *stages):
+        for stage in stages:
+            if stage not in self.STAGES:
+                raise Exception(f"{stage} is not a supported stage")
+        self.timings = {}
+        try:
+            for stage in stages:
+                start = time.perf_counter()
+                try:
+                    getattr(self, stage)()
+                finally:
+                    self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+        finally:
+            self.writer.discard()
+            # a stage that failed part way through a map update leaves nothing to persist
+            if self._is_map_consistent:
+                start = time.perf_counter()
+                self.persist()
+                self.timings["persist"] = time.perf_counter() - start
+            if self.writer.written or self.writer.unchanged:
+                self.writer.report()
+        return self
+
+
+def init(config_path=DEFAULT_CONFIG_PATH, validate=False):
     config = get_config(config_path)
-    if os.path.exists(config.string_index_filename):
+    storage = get_storage(config, validate)
+    if storage.exists():
         raise Exception("index file already exists")
 
-    string_files = _get_string_files(config)
     generic_languages = _get_generic_languages(config)
-    map = StringsMap(string_files, generic_languages)
-    map_dict = StringsMapSchema().dumps(map, indent=4, ensure_ascii=False, sort_keys=True)
-    with open(config.string_index_filename, 'w') as f:
-        f.write(map_dict)
+    if _use_partial_maps(config):
+        # the string files are not needed afterwards, so workers only send back their partial maps
+        with instrumentation.phase("files.load"):
+            _, partial_maps = _load_partial_maps(config, generic_languages, keep_files=False)
+        with instrumentation.phase("map.build"):
+            map = _merge_partial_maps(StringsMap(), partial_maps)
+    else:
+        with instrumentation.phase("files.load"):
+            string_files = _get_string_files(config)
+        with instrumentation.phase("map.build"):
+            map = StringsMap(string_files, generic_languages)
+    instrumentation.gauge("index.keys", len(map.index))
+    instrumentation.gauge("index.conflicts", map.conflict_count)
+    with instrumentation.phase("index.dump"):
+        storage.save(map)
+    journal = _get_journal(config)
+    if journal is not None:
+        journal.checkpoint(map, "init")
+
+
+def sync(config_path=DEFAULT_CONFIG_PATH, validate=False):
+    return Session(config_path, validate).run("sync").sheet_values
 
 
-def sync(config_path=DEFAULT_CONFIG_PATH):
-    print("starting sync")
+def save(config_path=DEFAULT_CONFIG_PATH, validate=False):
+    Session(config_path, validate).run("save")
+
+
+def deploy(config_path=DEFAULT_CONFIG_PATH, validate=False):
+    Session(config_path, validate).run("sync", "upload")
+
+
+def find_duplicates(config_path=DEFAULT_CONFIG_PATH, threshold=None, validate=False):
+    # clusters of near duplicate source strings in the index, largest first
+    from .translation_memory import DEFAULT_THRESHOLD
     config = get_config(config_path)
+    map = _load_index(config, get_storage(config, validate))
+    memory = _get_translation_memory(config)
+    with instrumentation.phase("tm.update"):
+        memory.update(map)
+    memory.save()
+    with instrumentation.phase("tm.clusters"):
+        return memory.get_clusters(threshold if threshold is not None else DEFAULT_THRESHOLD)
+
 
-    if not os.path.exists(config.string_index_filename):
+def lint(config_path=DEFAULT_CONFIG_PATH, validate=False):
+    # [LintIssue] for the whole index and the project's string files, see mtm.lint
+    from .lint import lint_files, lint_index
+    session = Session(config_path, validate)
+    with instrumentation.phase("lint.index"):
+        issues = lint_index(session.map, session.get_generic_languages(exclude_default=True))
+    with instrumentation.phase("lint.files"):
+        issues.extend(lint_files(_get_string_dir_groups(session.config, session.string_files), session.map))
+    return issues
+
+
+def _get_lookup_storage(config, validate):
+    # a sqlite index that is already in the current format answers lookups itself, anything else is loaded whole
+    storage = get_storage(config, validate)
+    if not storage.exists():
         raise Exception("The string index file is not created yet. Please call the \"init\" function to initalize the string index.")
+    if isinstance(storage, SqliteStorage) and storage.get_version() == INDEX_VERSION:
+        return storage, None
+    return None, _load_index(config, storage)
 
-    print("creating backup")
-    string_index_path = f"{os.getcwd()}/{config.string_index_filename}"
-    shutil.copyfile(string_index_path, f"{string_index_path}.{datetime.now().strftime('%s')}.bak")
 
-    print("getting current string index")
-    with open(config.string_index_filename, 'r') as f:
-        json_data = f.read()
-    map = StringsMapSchema().loads(json_data)
-    
-    print("loading string files")
-    generic_languages = _get_generic_languages(config)
-    string_files = _get_string_files(config)
+def find_strings(key=None, value=None, config_path=DEFAULT_CONFIG_PATH, validate=False):
+    # [StringIndex] with the given key, or the one with the given value
+    storage, map = _get_lookup_storage(get_config(config_path), validate)
+    if key is not None:
+        return storage.find_indexes_by_key(key) if storage else list(map.find_indexes_by_key(key))
+    string_index = storage.find_index_by_value(value) if storage else map.index.get(value)
+    return [string_index] if string_index is not None else []
 
-    print("syncing string index with project strings")
-    map.sync(string_files, generic_languages)
-    map.update_files(string_files)
 
-    print("syncing string index with google sheet")
-    fetch_from_google_sheet(config.sheets_api.spreadsheet_id, map)
+def find_translations(language, config_path=DEFAULT_CONFIG_PATH, validate=False):
+    # value -> translation for every string translated into language
+    storage, map = _get_lookup_storage(get_config(config_path), validate)
+    if storage:
+        return storage.find_translations_by_language(language)
+    return {
+        value: string_index.translations[language]
+        for value, string_index in map.index.items()
+        if language in string_index.translations
+    }
 
-    print('saving string index')
-    map_dict = StringsMapSchema().dumps(map, indent=4, ensure_ascii=False, sort_keys=True)
-    with open(config.string_index_filename, 'w') as f:
-        f.write(map_dict)
+
+def export_index(json_path, config_path=DEFAULT_CONFIG_PATH, validate=False):
+    config = get_config(config_path)
+    map = _load_index(config, get_storage(config, validate))
+    JsonStorage(json_path, validate).save(map)
 
 
-def save(config_path=DEFAULT_CONFIG_PATH):
+def import_index(json_path, config_path=DEFAULT_CONFIG_PATH, validate=False):
     config = get_config(config_path)
-    # todo: figure out how to incorperate this with the save
-    # need to make sure project files have the same keys as the default files
-    populate_with_new_keys(config_path)
-    with open(config.string_index_filename, 'r') as f:
-        json_data = f.read()
-    map = StringsMapSchema().loads(json_data)
-    string_files = _get_string_files(config)
-    map.update_files(string_files)
-
-
-def deploy(config_path=DEFAULT_CONFIG_PATH):
-    sync(config_path)
+    map = _load_index(config, JsonStorage(json_path, validate))
+    storage = get_storage(config, validate)
+    if storage.exists():
+        # lets the storage diff against what is already there
+        storage.load()
+    storage.save(map)
+    journal = _get_journal(config)
+    if journal is not None:
+        journal.checkpoint(map, "import")
+
+
+def get_history(config_path=DEFAULT_CONFIG_PATH):
+    # the journal's commits, oldest first, and the commits it has snapshots of
+    journal = _get_journal(get_config(config_path))
+    if journal is None:
+        raise Exception('the journal is off, set "journal": true in the config to turn it on')
+    return journal.get_commits(), [commit for commit, _ in journal.get_snapshots()]
+
+
+def restore_index(config_path=DEFAULT_CONFIG_PATH, commit=None, timestamp=None, validate=False):
+    # replaces the index with its state right after commit, or the last commit made at or before timestamp
     config = get_config(config_path)
-    with open(config.string_index_filename, 'r') as f:
-        json_data = f.read()
-    generic_languages = _get_generic_languages(config, exclude_default=True)
-    map = StringsMapSchema().loads(json_data)
-    upload_to_google_sheet(config.sheets_api.spreadsheet_id, map, generic_languages)
+    journal = _get_journal(config)
+    if journal is None:
+        raise Exception('the journal is off, set "journal": true in the config to turn it on')
+    if commit is None and timestamp is not None:
+        commit = journal.get_commit_at(timestamp)
+    with instrumentation.phase("journal.restore"):
+        map = _upgrade_index(config, journal.restore(commit))
+    storage = get_storage(config, validate)
+    if storage.exists():
+        storage.load()
+    with instrumentation.phase("index.dump"):
+        storage.save(map)
+    # the restore is a change of its own, later restores can go back to before it
+    journal.checkpoint(map, f"restore {commit}" if commit is not None else "restore")
+    return map
+
+
+def rollback(config_path=DEFAULT_CONFIG_PATH, validate=False):
+    # undoes the last commit
+    commits, _ = get_history(config_path)
+    if len(commits) < 2:
+        raise Exception("the journal has no earlier commit to roll back to")
+    return restore_index(config_path, commits[-2]["commit"], validate=validate)
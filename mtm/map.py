@@ -1,159 +1,488 @@
-from marshmallow import Schema, fields, post_load
+import hashlib
+import sys
+from types import MappingProxyType
 
-from .strings import STRING_TYPE
+from .strings import EMPTY_MAP, STRING_TYPE, get_placeholder_template
 
 
 FUZZY = "~fuzzy; "
+# format of the values stored in the index, older indexes are upgraded by mtm.migrations when loaded
+INDEX_VERSION = 4
+EMPTY_CONFLICTS = MappingProxyType({})
+SCHEMAS = ("StringKeySchema", "StringIndexSchema", "StringsMapSchema")
 
-class StringKeySchema(Schema):
-    key = fields.Str()
-    placeholder_map = fields.Dict(keys=fields.Int(), values=fields.Str())
 
-    @post_load
-    def make_string_key(self, data, **__):
-        return StringKey(**data)
+def __getattr__(name):
+    # the marshmallow schemas live in mtm.schema so marshmallow is only imported on validating paths
+    if name in SCHEMAS:
+        from . import schema
+        return getattr(schema, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-class StringKey:
+def parse_conflict(translation):
+    # "~fuzzy; a|b" -> ["a", "b"], anything else -> None
+    if translation and translation.startswith(FUZZY):
+        return translation[len(FUZZY):].split('|')
+    return None
+
 
-    def __init__(self, key, placeholder_map):
-        self.key = key
-        self.placeholder_map = placeholder_map
+def format_conflict(candidates):
+    return f'{FUZZY}{"|".join(candidates)}'
 
 
-class StringIndexSchema(Schema):
-    value = fields.Str()
-    type = fields.Str()
-    translatable = fields.Bool()
-    keys = fields.List(fields.Nested(StringKeySchema()))
-    translations = fields.Dict(keys=fields.Str(), values=fields.Str())
+class StringKey:
+    __slots__ = ('key', 'placeholder_map', 'platform')
 
-    @post_load
-    def make_string_index(self, data, **__):
-        return StringIndex(**data)
+    def __init__(self, key, placeholder_map, platform=None):
+        self.key = sys.intern(key) if key else key
+        self.placeholder_map = placeholder_map if placeholder_map else EMPTY_MAP
+        # platform of the default file the placeholders come from, None for keys indexed before it was recorded
+        self.platform = platform
 
 
 class StringIndex:
+    # most indexes have one key and no conflicts, so key lookups scan the list until it grows past
+    # KEY_SCAN_LIMIT and the conflicts dict only exists while there is a conflict
+    __slots__ = ('value', 'type', 'translatable', 'keys', 'translations', '_keys_by_name', '_conflicts', '_placeholder_signature')
+    KEY_SCAN_LIMIT = 8
 
-    def __init__(self, value, type, key=None, placeholder_map=None, languages=None, translatable=True, translations=None, keys=None):
+    def __init__(self, value, type, key=None, placeholder_map=None, languages=None, translatable=True, translations=None, keys=None, platform=None):
         self.value = value
         self.type = type
         self.translatable = translatable
-        if translations and keys:
+        if keys is not None:
             self.keys = keys
-            self.translations = translations
+            translations = translations if translations is not None else {}
+            self.translations = {sys.intern(language): translation for language, translation in translations.items()}
         else:
             self.keys = [
                 StringKey(
                     key,
-                    placeholder_map
+                    placeholder_map,
+                    platform
                 )
             ]
-            self.translations = { language: "" for language in languages } if languages else {}
-    
+            self.translations = { sys.intern(language): "" for language in languages } if languages else {}
+        self._keys_by_name = None
+        if len(self.keys) > self.KEY_SCAN_LIMIT:
+            self._keys_by_name = {string_key.key: string_key for string_key in self.keys}
+        self._placeholder_signature = None
+        # language -> candidate translations; the "~fuzzy;" strings are only parsed here
+        self._conflicts = None
+        for language, translation in self.translations.items():
+            candidates = parse_conflict(translation)
+            if candidates is not None:
+                if self._conflicts is None:
+                    self._conflicts = {}
+                self._conflicts[language] = candidates
+
+    @property
+    def conflicts(self):
+        return self._conflicts if self._conflicts is not None else EMPTY_CONFLICTS
+
+    @property
+    def placeholder_signature(self):
+        # the placeholder indexes of the value in order, e.g. "{0} of {1}" -> (0, 1); computed once per index
+        if self._placeholder_signature is None:
+            self._placeholder_signature = get_placeholder_template(self.value)[1::2]
+        return self._placeholder_signature
+
+    def has_key(self, key):
+        return self.get_key(key) is not None
+
+    def get_key(self, key):
+        if self._keys_by_name is not None:
+            return self._keys_by_name.get(key)
+        for string_key in self.keys:
+            if string_key.key == key:
+                return string_key
+        return None
+
+    def add_key(self, string_key):
+        if self.has_key(string_key.key):
+            return False
+        self.keys.append(string_key)
+        if self._keys_by_name is not None:
+            self._keys_by_name[string_key.key] = string_key
+        elif len(self.keys) > self.KEY_SCAN_LIMIT:
+            self._keys_by_name = {string_key.key: string_key for string_key in self.keys}
+        return True
+
+    def fill_platform(self, string_key):
+        # a key indexed before platforms were recorded takes the platform of the first default file whose
+        # placeholders it matches
+        existing = self.get_key(string_key.key)
+        if existing is None or existing.platform is not None or string_key.platform is None:
+            return False
+        if existing.placeholder_map != string_key.placeholder_map:
+            return False
+        existing.platform = string_key.platform
+        return True
+
+    def has_conflict(self, language):
+        return language in self.conflicts
+
+    def set_translation(self, language, translation):
+        # returns True when this resolved a conflict
+        self.translations[language] = translation
+        if self._conflicts is None or self._conflicts.pop(language, None) is None:
+            return False
+        if not self._conflicts:
+            self._conflicts = None
+        return True
 
-class StringsMapSchema(Schema):
-    index = fields.Dict(keys=fields.Str(), values=fields.Nested(StringIndexSchema()))
+    def set_conflict(self, language, candidates):
+        # returns True when this is a new conflict
+        if self._conflicts is None:
+            self._conflicts = {}
+        is_new = language not in self._conflicts
+        self._conflicts[language] = list(candidates)
+        self.translations[language] = format_conflict(self._conflicts[language])
+        return is_new
+
+    def add_candidates(self, language, candidates):
+        conflicts = self.conflicts[language]
+        new_candidates = [candidate for candidate in candidates if candidate not in conflicts]
+        if new_candidates:
+            conflicts.extend(new_candidates)
+            self.translations[language] = format_conflict(conflicts)
+        return bool(new_candidates)
+
+
+def string_index_to_dict(string_index):
+    return {
+        "value": string_index.value,
+        "type": string_index.type,
+        "translatable": string_index.translatable,
+        "keys": [
+            {
+                "key": string_key.key,
+                "placeholder_map": {int(index): placeholder for index, placeholder in string_key.placeholder_map.items()},
+                "platform": string_key.platform,
+            }
+            for string_key in string_index.keys
+        ],
+        "translations": dict(string_index.translations),
+    }
+
+
+def string_index_from_dict(data):
+    return StringIndex(
+        data["value"],
+        data["type"],
+        translatable=data["translatable"],
+        translations=data["translations"],
+        keys=[
+            StringKey(
+                string_key["key"],
+                {int(index): placeholder for index, placeholder in string_key["placeholder_map"].items()},
+                string_key.get("platform")
+            )
+            for string_key in data["keys"]
+        ]
+    )
+
+
+def strings_map_to_dict(strings_map):
+    # mirrors StringsMapSchema().dump without going through marshmallow
+    return {
+        "version": strings_map.version,
+        "index": {
+            value: string_index_to_dict(string_index)
+            for value, string_index in strings_map.index.items()
+        }
+    }
+
+
+def strings_map_from_dict(data):
+    # mirrors StringsMapSchema().load without validation, an index without a version predates versioning
+    return StringsMap(
+        index={value: string_index_from_dict(string_index) for value, string_index in data["index"].items()},
+        version=data.get("version", 1)
+    )
 
-    @post_load
-    def make_strings_map(self, data, **__):
-        return StringsMap(**data)
 
 class StringsMap:
     # only string types supported at the moment
     
-    def __init__(self, string_files=None, languages=None, index=None):
+    def __init__(self, string_files=None, languages=None, index=None, version=INDEX_VERSION):
+        self.version = version
+        # key -> list of string indexes containing that key, in insertion order
+        self._key_index = {}
+        self.conflict_count = 0
+        # translations of added files that are not applied yet, see add_files()
+        self._pending = []
+        # a Journal that records every change made to the index, see mtm.journal
+        self.journal = None
         if string_files and languages:
             self.index = {}
             self._map(string_files, languages)
         else:
-            self.index = index
+            self.index = index if index is not None else {}
+            for string_index in self.index.values():
+                self._register_index(string_index)
+                self.conflict_count += len(string_index.conflicts)
+
+    def _register_index(self, string_index):
+        for string_key in string_index.keys:
+            self._register_key(string_key.key, string_index)
+
+    def _register_key(self, key, string_index):
+        indexes = self._key_index.setdefault(key, [])
+        if string_index not in indexes:
+            indexes.append(string_index)
+
+    def add_index(self, string_index):
+        self.index[string_index.value] = string_index
+        self._register_index(string_index)
+        self.conflict_count += len(string_index.conflicts)
+        if self.journal is not None:
+            self.journal.record_index(string_index)
+
+    def add_key(self, string_index, string_key):
+        if string_index.add_key(string_key):
+            self._register_key(string_key.key, string_index)
+            if self.journal is not None:
+                self.journal.record_key(string_index, string_key)
+        elif string_index.fill_platform(string_key) and self.journal is not None:
+            self.journal.record_key(string_index, string_key)
+
+    def find_index_by_key(self, key):
+        indexes = self._key_index.get(key)
+        return indexes[0] if indexes else None
+
+    def find_indexes_by_key(self, key):
+        return self._key_index.get(key, [])
+
+    def _set_translation(self, string_index, language, translation):
+        old_translation = string_index.translations.get(language)
+        if string_index.set_translation(language, translation):
+            self.conflict_count -= 1
+        if self.journal is not None:
+            self.journal.record_translation(string_index, language, old_translation)
+
+    def _set_conflict(self, string_index, language, candidates):
+        old_translation = string_index.translations.get(language)
+        if string_index.set_conflict(language, candidates):
+            self.conflict_count += 1
+        if self.journal is not None:
+            self.journal.record_translation(string_index, language, old_translation)
+
+    def _add_candidates(self, string_index, language, candidates):
+        old_translation = string_index.translations.get(language)
+        if string_index.add_candidates(language, candidates) and self.journal is not None:
+            self.journal.record_translation(string_index, language, old_translation)
+
+    def has_conflicts(self):
+        return self.conflict_count > 0
+
+    def get_conflicts(self):
+        # [(value, language, candidates, keys)] for every translation that needs resolving
+        if not self.conflict_count:
+            return []
+        return [
+            (string_index.value, language, list(candidates), [string_key.key for string_key in string_index.keys])
+            for string_index in self.index.values()
+            for language, candidates in string_index.conflicts.items()
+        ]
+
+    def resolve_conflict(self, value, language, translation):
+        self._set_translation(self.index[value], language, translation)
+
+    def set_translation(self, value, language, translation):
+        # sets translation as is, a "~fuzzy;" translation becomes a conflict again
+        candidates = parse_conflict(translation)
+        if candidates is not None:
+            self._set_conflict(self.index[value], language, candidates)
+        else:
+            self._set_translation(self.index[value], language, translation)
 
     def _map(self, string_files, languages):
-        def find_index_by_key(key):
-            for index in self.index.values():
-                if key in [k.key for k in index.keys]:
-                    return index
-
-        def update_index(key, language, value):
-            for index in self.index.values():
-                if key in [k.key for k in index.keys]:
-                    index.translations[language] = value
-
-        default_files = list(filter(lambda d: d.default == True, string_files))
-        for default_file in default_files:
+        self.add_files(string_files, languages)
+        self.apply_pending()
+
+    def add_files(self, string_files, languages):
+        # default files go into the index right away, translations are queued for apply_pending() since
+        # every default file, wherever it comes from, has to be in the index before any translation is applied
+        for default_file in filter(lambda d: d.default == True, string_files):
             for string_item in list(filter(lambda s: s.type == STRING_TYPE and s.translatable, default_file.values)):
                 if string_item.parsed_value in self.index:
-                    keys = self.index[string_item.parsed_value].keys
-                    existing_keys = [key for key in keys if key.key == string_item.key]
-                    if not len(existing_keys):
-                        keys.append(
+                    string_index = self.index[string_item.parsed_value]
+                    string_key = string_index.get_key(string_item.key)
+                    if string_key is None or string_key.platform is None:
+                        self.add_key(
+                            string_index,
                             StringKey(
                                 string_item.key,
-                                string_item.placeholder_map
+                                string_item.placeholder_map,
+                                default_file.platform
                             )
                         )
                 else:
-                    self.index[string_item.parsed_value] = StringIndex(
-                        string_item.parsed_value,
-                        STRING_TYPE,
-                        string_item.key,
-                        string_item.placeholder_map,
-                        languages,
-                        string_item.translatable
+                    self.add_index(
+                        StringIndex(
+                            string_item.parsed_value,
+                            STRING_TYPE,
+                            string_item.key,
+                            string_item.placeholder_map,
+                            languages,
+                            string_item.translatable,
+                            platform=default_file.platform
+                        )
                     )
 
-        translation_files = list(filter(lambda d: d.default == False, string_files))
-        for translation_file in translation_files:
-            for string_item in list(filter(lambda s: s.type == STRING_TYPE and s.translatable, translation_file.values)):
-                index = find_index_by_key(string_item.key)
-                try:
-                    raw_value = index.value
-                except Exception:
-                    raise Exception(f'error with value: {string_item.key} - {translation_file.language}\npath: {translation_file.filepath}')
-                translated_value = index.translations.get(translation_file.generic_language, raw_value)
-                if translated_value and string_item.parsed_value != raw_value:
-                    if FUZZY in translated_value:
-                        conflicts = translated_value.replace(FUZZY, "").split('|')
-                        if string_item.parsed_value not in conflicts:
-                            conflicts.append(string_item.parsed_value)
-                            new_value = f'{FUZZY}{"|".join(conflicts)}'
-                            update_index(string_item.key, translation_file.generic_language, new_value)
-                    elif raw_value != translated_value and translated_value != string_item.parsed_value:
-                        update_index(string_item.key, translation_file.generic_language, f'{FUZZY}{translated_value}|{string_item.parsed_value}')
-                    elif raw_value == translated_value and string_item.parsed_value not in [translated_value, raw_value]:
-                        update_index(string_item.key, translation_file.generic_language, string_item.parsed_value)
-                elif string_item.parsed_value:
-                    # todo: this could be problematic
-                    update_index(string_item.key, translation_file.generic_language, string_item.parsed_value)
+        for translation_file in filter(lambda d: d.default == False, string_files):
+            language = translation_file.generic_language
+            self._pending.extend(
+                (string_item.key, language, string_item.parsed_value, translation_file.language, translation_file.filepath)
+                for string_item in translation_file.values
+                if string_item.type == STRING_TYPE and string_item.translatable
+            )
+
+    def apply_pending(self):
+        pending = self._pending
+        self._pending = []
+        for key, language, parsed_value, file_language, filepath in pending:
+            self._apply_translation(key, language, parsed_value, file_language, filepath)
+
+    def _apply_translation(self, key, language, parsed_value, file_language, filepath):
+        index = self.find_index_by_key(key)
+        try:
+            raw_value = index.value
+        except Exception:
+            raise Exception(f'error with value: {key} - {file_language}\npath: {filepath}')
+        translated_value = index.translations.get(language, raw_value)
+        if translated_value and parsed_value != raw_value:
+            if index.has_conflict(language):
+                conflicts = index.conflicts[language]
+                if parsed_value not in conflicts:
+                    self._update_conflict(key, language, [*conflicts, parsed_value])
+            elif raw_value != translated_value and translated_value != parsed_value:
+                self._update_conflict(key, language, [translated_value, parsed_value])
+            elif raw_value == translated_value and parsed_value not in [translated_value, raw_value]:
+                self._update_index(key, language, parsed_value)
+        elif parsed_value:
+            # todo: this could be problematic
+            self._update_index(key, language, parsed_value)
+
+    def _update_index(self, key, language, value):
+        for index in self.find_indexes_by_key(key):
+            self._set_translation(index, language, value)
+
+    def _update_conflict(self, key, language, candidates):
+        for index in self.find_indexes_by_key(key):
+            self._set_conflict(index, language, candidates)
+
+    @classmethod
+    def from_files(cls, string_files, languages):
+        # a partial map of some of the project's files, finished by merging it into a map and calling apply_pending()
+        partial = cls()
+        partial.add_files(string_files, languages)
+        return partial
+
+    def merge(self, other):
+        # folds other in as if its files had been added after this map's: values and keys of other are added
+        # in other's order, keys keep their lookup order and other's queued translations follow this map's.
+        # (a.merge(b)).merge(c) and a.merge(b.merge(c)) give the same map; other is consumed
+        merged = {}
+        for value, string_index in other.index.items():
+            existing = self.index.get(value)
+            if existing is None:
+                self.index[value] = string_index
+                self.conflict_count += len(string_index.conflicts)
+                merged[id(string_index)] = string_index
+                if self.journal is not None:
+                    self.journal.record_index(string_index)
+            else:
+                for string_key in string_index.keys:
+                    if (existing.add_key(string_key) or existing.fill_platform(string_key)) and self.journal is not None:
+                        self.journal.record_key(existing, string_key)
+                merged[id(string_index)] = existing
+        for key, indexes in other._key_index.items():
+            for string_index in indexes:
+                self._register_key(key, merged[id(string_index)])
+        self._pending.extend(other._pending)
+        other.index = {}
+        other._key_index = {}
+        other._pending = []
+        return self
 
     def sync(self, strings_files, languages):
         self._map(strings_files, languages)
 
-    def update_files(self, string_files=None):
-        has_fuzzy = next(filter(lambda i: next(filter(lambda v: FUZZY in v, i.translations.values()), None) is not None, self.index.values()), None)
-        if has_fuzzy:
-            raise Exception("!!! you must resolve fuzzy translations before saving !!!")
+    def update_files(self, string_files=None, writer=None):
+        if self.has_conflicts():
+            raise Exception(f"!!! you must resolve {self.conflict_count} fuzzy translations before saving !!!")
 
         if string_files:
             self.string_files = string_files
         
         for string_file in self.string_files:
-            string_file.update_values(self)
+            string_file.update_values(self, writer)
 
     def update(self, key, language, translation):
         string_index = self.index[key]
-        translated_value = string_index.translations[language]
+        self._update_translation(string_index, key, language, string_index.translations[language], translation)
+
+    def _update_translation(self, string_index, key, language, translated_value, translation):
         translation = translation if translation else key
-        if FUZZY in translated_value:
-            conflicts = translated_value.replace(FUZZY, "").split('|')
-            if translation not in conflicts:
-                conflicts.append(translation)
-                new_value = f'{FUZZY}{"|".join(conflicts)}'
-                string_index.translations[language] = new_value
+        if string_index.has_conflict(language):
+            # a conflict echoed back from the sheet adds its candidates instead of nesting
+            self._add_candidates(string_index, language, parse_conflict(translation) or [translation])
         elif not translated_value:
-            string_index.translations[language] = key
+            self._set_translation(string_index, language, key)
         elif key != translated_value and translated_value != translation:
-            string_index.translations[language] = f'{FUZZY}{translated_value}|{translation}'
+            self._set_conflict(string_index, language, [translated_value, *(parse_conflict(translation) or [translation])])
         elif key == translated_value and translation not in [translated_value, key]:
-            string_index.translations[language] = translation
+            self._set_translation(string_index, language, translation)
+
+    def apply_table(self, header, rows, row_hashes=None):
+        # bulk version of update for a sheet: header is [source language, *languages], rows are [value, *translations]
+        # row_hashes (value -> hash) is updated in place. A row is hashed along with the index's current translations
+        # for its languages, and only rows whose apply changed nothing are recorded, so a skipped row is one that
+        # would leave the index untouched
+        columns = [(column, language) for column, language in enumerate(header) if column > 0 and language]
+        header_hash = "\x1f".join(header)
+        conflict_count = self.conflict_count
+        summary = {
+            'rows': len(rows),
+            'unchanged_rows': 0,
+            'unknown_rows': 0,
+            'updated_cells': 0,
+            'new_conflicts': 0,
+        }
+        for row in rows:
+            if not row or not row[0]:
+                continue
+            key = row[0]
+            string_index = self.index.get(key)
+            if string_index is None:
+                summary['unknown_rows'] += 1
+                continue
+            translations = string_index.translations
+            if row_hashes is not None:
+                state = "\x1f".join(translations.get(language, "\x00") for _, language in columns)
+                row_hash = hashlib.blake2b("\x1e".join([header_hash, "\x1f".join(row), state]).encode(), digest_size=16).hexdigest()
+                if row_hashes.get(key) == row_hash:
+                    summary['unchanged_rows'] += 1
+                    continue
+            updated_cells = summary['updated_cells']
+            for column, language in columns:
+                translated_value = translations.get(language)
+                if translated_value is None:
+                    continue
+                translation = (row[column] if column < len(row) else "") or key
+                if translated_value and translation == translated_value:
+                    # update would leave it untouched
+                    continue
+                self._update_translation(string_index, key, language, translated_value, translation)
+                if translations[language] != translated_value:
+                    summary['updated_cells'] += 1
+            if row_hashes is not None:
+                if summary['updated_cells'] == updated_cells:
+                    row_hashes[key] = row_hash
+                else:
+                    row_hashes.pop(key, None)
+        summary['new_conflicts'] = self.conflict_count - conflict_count
+        return summary
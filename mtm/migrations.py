@@ -0,0 +1,119 @@
+import re
+
+from .map import INDEX_VERSION, StringIndex, StringKey, StringsMap, format_conflict, parse_conflict
+from .output import echo
+from .strings import parse_placeholders, render_placeholders
+
+re_escape = re.compile(r'\\(.)', re.DOTALL)
+
+
+def convert_translation(translation, convert):
+    # a "~fuzzy;" translation has each of its candidates converted, and stops being a conflict once they
+    # all convert to the same translation
+    if not translation:
+        return translation
+    candidates = parse_conflict(translation)
+    if candidates is None:
+        return convert(translation)
+    candidates = list(dict.fromkeys(convert(candidate) for candidate in candidates))
+    return format_conflict(candidates) if len(candidates) > 1 else candidates[0]
+
+
+def rebuild(strings_map, convert_index):
+    # convert_index(string_index) -> [(value, keys, translations)]; indexes whose values become the same are
+    # merged, the first one keeps its translations and only gets the ones it is missing from the others
+    entries = {}
+    for string_index in strings_map.index.values():
+        for value, keys, translations in convert_index(string_index):
+            entry = entries.get(value)
+            if entry is None:
+                entries[value] = (string_index.type, string_index.translatable, list(keys), dict(translations))
+                continue
+            _, _, entry_keys, entry_translations = entry
+            names = {string_key.key for string_key in entry_keys}
+            entry_keys.extend(string_key for string_key in keys if string_key.key not in names)
+            for language, translation in translations.items():
+                if not entry_translations.get(language):
+                    entry_translations[language] = translation
+    index = {
+        value: StringIndex(value, type, translatable=translatable, translations=translations, keys=keys)
+        for value, (type, translatable, keys, translations) in entries.items()
+    }
+    return StringsMap(index=index, version=strings_map.version)
+
+
+def unescape_quotes(strings_map, platforms):
+    # the parsers now undo the quote escapes their writers add, values read before that still hold them.
+    # android keeps \" since a bare " means something else there, so only \' is undone for its projects
+    quotes = "'" if "android" in platforms else "'\""
+
+    def unescape(value):
+        if '\\' not in value:
+            return value
+        return re_escape.sub(lambda match: match.group(1) if match.group(1) in quotes else match.group(0), value)
+
+    def convert_index(string_index):
+        translations = {
+            language: convert_translation(translation, unescape)
+            for language, translation in string_index.translations.items()
+        }
+        return [(unescape(string_index.value), string_index.keys, translations)]
+
+    return rebuild(strings_map, convert_index)
+
+
+def reparse_placeholders(strings_map, platforms):
+    # the placeholder grammar now covers flags, width, precision and length modifiers, so "%1$@" or "%.2f"
+    # stayed literal text in values parsed before. Every value is rendered with its key's placeholders and
+    # parsed again, which gives what the string files parse to now
+    def reparse(value, placeholder_map):
+        return parse_placeholders(render_placeholders(value, placeholder_map))
+
+    def convert_index(string_index):
+        # keys of one value normally parse to the same new value, any that do not get an index of their own
+        entries = {}
+        for string_key in string_index.keys:
+            value, placeholders = reparse(string_index.value, string_key.placeholder_map)
+            entry = entries.get(value)
+            if entry is None:
+                translations = {
+                    language: convert_translation(translation, lambda translation: reparse(translation, string_key.placeholder_map)[0])
+                    for language, translation in string_index.translations.items()
+                }
+                entry = entries[value] = ([], translations)
+            entry[0].append(StringKey(string_key.key, dict(enumerate(placeholders)), string_key.platform))
+        return [(value, keys, translations) for value, (keys, translations) in entries.items()]
+
+    return rebuild(strings_map, convert_index)
+
+
+def record_platforms(strings_map, platforms):
+    # keys now record the platform their placeholders come from, so genuine iOS "%s" is not turned into "%@".
+    # With a single platform every key comes from it; otherwise keys stay unknown until a sync finds them in
+    # a default file
+    if len(platforms) == 1:
+        platform = next(iter(platforms))
+        for string_index in strings_map.index.values():
+            for string_key in string_index.keys:
+                string_key.platform = platform
+    return strings_map
+
+
+# (version, migration) in order, each migration(strings_map, platforms) returns the map in that version's format
+MIGRATIONS = [
+    (2, unescape_quotes),
+    (3, reparse_placeholders),
+    (4, record_platforms),
+]
+
+
+def migrate(strings_map, platforms):
+    # returns strings_map upgraded to INDEX_VERSION, platforms are the platforms of the project's applications
+    if strings_map.version > INDEX_VERSION:
+        raise Exception(f"the string index is version {strings_map.version}, this release only reads up to version {INDEX_VERSION}")
+    for version, migration in MIGRATIONS:
+        if strings_map.version < version:
+            echo(f"upgrading string index to version {version}")
+            strings_map = migration(strings_map, platforms)
+            strings_map.version = version
+    return strings_map
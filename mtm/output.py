@@ -0,0 +1,21 @@
+import contextvars
+import sys
+from contextlib import contextmanager
+
+# the stream messages go to in the current context, sys.stdout when none is set. A batch sets one per project
+# so sys.stdout itself is never swapped
+_stream = contextvars.ContextVar("stream", default=None)
+
+
+def echo(*args):
+    print(*args, file=_stream.get() or sys.stdout)
+
+
+@contextmanager
+def capture(stream):
+    # everything echoed in this context goes to stream until the block exits
+    token = _stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _stream.reset(token)
@@ -0,0 +1,35 @@
+from marshmallow import Schema, fields, post_load
+
+from .map import StringIndex, StringKey, StringsMap
+
+
+class StringKeySchema(Schema):
+    key = fields.Str()
+    placeholder_map = fields.Dict(keys=fields.Int(), values=fields.Str())
+    platform = fields.Str(allow_none=True)
+
+    @post_load
+    def make_string_key(self, data, **__):
+        return StringKey(**data)
+
+
+class StringIndexSchema(Schema):
+    value = fields.Str()
+    type = fields.Str()
+    translatable = fields.Bool()
+    keys = fields.List(fields.Nested(StringKeySchema()))
+    translations = fields.Dict(keys=fields.Str(), values=fields.Str())
+
+    @post_load
+    def make_string_index(self, data, **__):
+        return StringIndex(**data)
+
+
+class StringsMapSchema(Schema):
+    version = fields.Int()
+    index = fields.Dict(keys=fields.Str(), values=fields.Nested(StringIndexSchema()))
+
+    @post_load
+    def make_strings_map(self, data, **__):
+        # an index without a version predates versioning
+        return StringsMap(**{"version": 1, **data})
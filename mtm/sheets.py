@@ -1,27 +1,228 @@
-import gspread
-
-
-def fetch_from_google_sheet(spreadsheet_id, strings_map):
-    gc = gspread.oauth(credentials_filename='credentials.json')
-    wks = gc.open_by_key(spreadsheet_id).sheet1
-    
-    items = wks.get_all_values()
-    languages = items.pop(0)
-    for item in items:
-        key = item[0]
-        for index, translation in enumerate(item):
-            strings_map.update(key, languages[index], translation)
-
-
-def upload_to_google_sheet(spreadsheet_id, strings_map, languages):
-    gc = gspread.oauth(credentials_filename='credentials.json')
-    wks = gc.open_by_key(spreadsheet_id).sheet1
-    wks.clear()
-    rows = [["en", *languages]]
-    for index in strings_map.index.values():
+import random
+import re
+import threading
+import time
+
+from .output import echo
+
+SOURCE_LANGUAGE_COLUMN = "en"
+# the values api accepts much larger requests, these keep each call well under the payload limits
+MAX_BATCH_CELLS = 10000
+MAX_BATCH_RANGES = 500
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+re_a1 = re.compile(r'^([A-Z]+)(\d+)$')
+
+
+def get_column_letter(column):
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def get_a1(row, column):
+    return f'{get_column_letter(column)}{row}'
+
+
+def parse_a1(a1):
+    letters, row = re_a1.match(a1).groups()
+    column = 0
+    for letter in letters:
+        column = column * 26 + ord(letter) - ord('A') + 1
+    return int(row), column
+
+
+class LocalWorksheet:
+    # in memory stand-in for a gspread worksheet, for trying out uploads without the sheets api
+
+    def __init__(self, values=None, row_count=1000, col_count=26):
+        self.row_count = row_count
+        self.col_count = col_count
+        self.cells = {}
+        self.requests = []
+        if values:
+            self.batch_update([{'range': get_a1(1, 1), 'values': values}])
+            self.requests.clear()
+
+    def get_all_values(self):
+        if not self.cells:
+            return []
+        rows = max(row for row, _ in self.cells)
+        columns = max(column for _, column in self.cells)
+        return [[self.cells.get((row, column), "") for column in range(1, columns + 1)] for row in range(1, rows + 1)]
+
+    def batch_update(self, data, **__):
+        self.requests.append(data)
+        for update in data:
+            start_row, start_column = parse_a1(update['range'].split(':')[0])
+            for row_offset, row in enumerate(update['values']):
+                for column_offset, value in enumerate(row):
+                    position = (start_row + row_offset, start_column + column_offset)
+                    if position[0] > self.row_count or position[1] > self.col_count:
+                        raise Exception(f"{update['range']} is outside of the worksheet")
+                    if value == "":
+                        self.cells.pop(position, None)
+                    else:
+                        self.cells[position] = value
+
+    def resize(self, rows=None, cols=None):
+        self.row_count = rows if rows else self.row_count
+        self.col_count = cols if cols else self.col_count
+        self.cells = {
+            position: value for position, value in self.cells.items()
+            if position[0] <= self.row_count and position[1] <= self.col_count
+        }
+
+    def clear(self):
+        self.cells = {}
+
+    def insert_rows(self, values, row=1, **__):
+        shifted = {(r + len(values) if r >= row else r, c): value for (r, c), value in self.cells.items()}
+        self.cells = shifted
+        self.row_count += len(values)
+        self.batch_update([{'range': get_a1(row, 1), 'values': values}])
+
+
+# credentials filename -> authorized gspread client, so a process only goes through oauth once
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(credentials_filename='credentials.json'):
+    with _clients_lock:
+        client = _clients.get(credentials_filename)
+        if client is None:
+            # gspread pulls in the google auth stack, so it is only imported once a real sheet is needed
+            import gspread
+            client = _clients[credentials_filename] = gspread.oauth(credentials_filename=credentials_filename)
+    return client
+
+
+def _get_worksheet(spreadsheet_id):
+    return get_client().open_by_key(spreadsheet_id).sheet1
+
+
+def _with_backoff(request, *args, **kwargs):
+    for attempt in range(MAX_RETRIES):
+        try:
+            return request(*args, **kwargs)
+        except Exception as e:
+            from gspread.exceptions import APIError
+            if not isinstance(e, APIError):
+                raise
+            response = getattr(e, 'response', None)
+            status_code = getattr(response, 'status_code', None)
+            if attempt == MAX_RETRIES - 1 or status_code not in RETRY_STATUS_CODES:
+                raise
+            delay = 2 ** attempt + random.random()
+            echo(f"sheets api returned {status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def fetch_from_google_sheet(spreadsheet_id, strings_map, wks=None, row_hashes=None):
+    wks = wks if wks else _get_worksheet(spreadsheet_id)
+
+    sheet_values = _with_backoff(wks.get_all_values)
+    if sheet_values:
+        summary = strings_map.apply_table(sheet_values[0], sheet_values[1:], row_hashes)
+        echo(f"applied {summary['updated_cells']} cells from {summary['rows'] - summary['unchanged_rows']} changed rows ({summary['new_conflicts']} new conflicts, {summary['unknown_rows']} unknown rows)")
+    return sheet_values
+
+
+def get_sheet_rows(strings_map, languages, row_order=None):
+    # rows already on the sheet keep their position so unrelated cells do not move
+    values = list(strings_map.index.keys())
+    if row_order:
+        existing = [value for value in row_order if value in strings_map.index]
+        existing_values = set(existing)
+        values = existing + [value for value in values if value not in existing_values]
+
+    rows = [[SOURCE_LANGUAGE_COLUMN, *languages]]
+    for value in values:
+        index = strings_map.index[value]
         row = [index.value]
-        for language, translation in index.translations.items():
-            if language in languages:
-                row.append("" if translation == index.value else translation)
+        for language in languages:
+            translation = index.translations.get(language, "")
+            row.append("" if translation == index.value else translation)
         rows.append(row)
-    wks.insert_rows(rows)
+    return rows
+
+
+def get_cell_changes(current_values, rows, base_values=None):
+    # [(row, column, value)] for every cell that differs, skipping cells edited on the sheet since base_values was read
+    def get_cell(values, row, column):
+        if row < len(values) and column < len(values[row]):
+            return values[row][column]
+        return ""
+
+    changes = []
+    kept_edits = 0
+    row_count = max(len(current_values), len(rows))
+    column_count = max([len(row) for row in current_values] + [len(row) for row in rows] + [0])
+    for row in range(row_count):
+        for column in range(column_count):
+            value = get_cell(rows, row, column)
+            current_value = get_cell(current_values, row, column)
+            if value == current_value:
+                continue
+            is_same_row = get_cell(rows, row, 0) == get_cell(current_values, row, 0)
+            if base_values is not None and is_same_row and current_value != get_cell(base_values, row, column):
+                kept_edits += 1
+                continue
+            changes.append((row + 1, column + 1, value))
+    return changes, kept_edits
+
+
+def get_update_batches(changes):
+    # contiguous cells in a row become one range, ranges are grouped into api sized batches
+    ranges = []
+    for row, column, value in changes:
+        if ranges and ranges[-1][0] == row and ranges[-1][1] + len(ranges[-1][2]) == column:
+            ranges[-1][2].append(value)
+        else:
+            ranges.append((row, column, [value]))
+
+    batches = []
+    batch = []
+    batch_cells = 0
+    for row, column, values in ranges:
+        if batch and (batch_cells + len(values) > MAX_BATCH_CELLS or len(batch) >= MAX_BATCH_RANGES):
+            batches.append(batch)
+            batch = []
+            batch_cells = 0
+        batch.append({
+            'range': f'{get_a1(row, column)}:{get_a1(row, column + len(values) - 1)}',
+            'values': [values],
+        })
+        batch_cells += len(values)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def upload_to_google_sheet(spreadsheet_id, strings_map, languages, base_values=None, wks=None):
+    wks = wks if wks else _get_worksheet(spreadsheet_id)
+    current_values = _with_backoff(wks.get_all_values)
+    rows = get_sheet_rows(strings_map, languages, [row[0] for row in current_values[1:] if row])
+    changes, kept_edits = get_cell_changes(current_values, rows, base_values)
+
+    row_count = max(len(rows), wks.row_count)
+    col_count = max(len(rows[0]), wks.col_count)
+    if (row_count, col_count) != (wks.row_count, wks.col_count):
+        _with_backoff(wks.resize, rows=row_count, cols=col_count)
+
+    batches = get_update_batches(changes)
+    for batch in batches:
+        _with_backoff(wks.batch_update, batch)
+
+    if kept_edits:
+        echo(f"kept {kept_edits} cells edited on the sheet since the last sync")
+    echo(f"updated {len(changes)} cells in {len(batches)} requests")
+    return {
+        'updated_cells': len(changes),
+        'requests': len(batches),
+        'kept_edits': kept_edits,
+    }
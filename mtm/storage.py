@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+
+from .map import StringIndex, StringKey, StringsMap, strings_map_from_dict, strings_map_to_dict
+from .writer import write_file
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS string_index (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL,
+    translatable INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS string_key (
+    index_id INTEGER NOT NULL REFERENCES string_index(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    platform TEXT,
+    PRIMARY KEY (index_id, key)
+);
+CREATE INDEX IF NOT EXISTS string_key_key ON string_key(key);
+CREATE TABLE IF NOT EXISTS placeholder (
+    index_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    placeholder TEXT NOT NULL,
+    PRIMARY KEY (index_id, key, position),
+    FOREIGN KEY (index_id, key) REFERENCES string_key(index_id, key) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS translation (
+    index_id INTEGER NOT NULL REFERENCES string_index(id) ON DELETE CASCADE,
+    language TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (index_id, language)
+);
+CREATE INDEX IF NOT EXISTS translation_language ON translation(language);
+'''
+
+
+def _get_keys_row(string_index):
+    return tuple(
+        (string_key.key, tuple(sorted((string_key.placeholder_map or {}).items())), string_key.platform)
+        for string_key in string_index.keys
+    )
+
+
+def _get_digests(string_index):
+    # 16 byte digests stand in for the keys and translations a row was last read or written with
+    keys = repr(_get_keys_row(string_index)).encode('utf-8')
+    translations = repr(sorted(string_index.translations.items())).encode('utf-8')
+    return hashlib.blake2b(keys, digest_size=16).digest(), hashlib.blake2b(translations, digest_size=16).digest()
+
+
+class JsonStorage:
+
+    def __init__(self, path, validate=False):
+        self.path = path
+        self.validate = validate
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            if self.validate:
+                from .schema import StringsMapSchema
+                return StringsMapSchema().loads(f.read())
+            return strings_map_from_dict(json.load(f))
+
+    def save(self, strings_map):
+        if self.validate:
+            from .schema import StringsMapSchema
+            data = StringsMapSchema().dump(strings_map)
+        else:
+            data = strings_map_to_dict(strings_map)
+        write_file(self.path, lambda f: json.dump(data, f, indent=4, ensure_ascii=False, sort_keys=True), stream=True)
+
+
+class SqliteStorage:
+    # load() reads the whole index into a StringsMap like the json one, and save() only writes the rows whose
+    # digest changed since the last load or save. The find_* lookups read just the rows they match through the
+    # indexes on keys, values and languages, without loading the rest
+
+    def __init__(self, path, validate=False):
+        self.path = path
+        self.validate = validate
+        self._connection = None
+        # value -> (row id, attributes, digest of the keys, digest of the translations) as last read or written
+        self._rows = {}
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            import sqlite3
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute('PRAGMA foreign_keys = ON')
+            self._connection.executescript(SCHEMA)
+            # databases from before platforms were recorded lack the column
+            columns = {row[1] for row in self._connection.execute('PRAGMA table_info(string_key)')}
+            if 'platform' not in columns:
+                with self._connection:
+                    self._connection.execute('ALTER TABLE string_key ADD COLUMN platform TEXT')
+        return self._connection
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _validate(self, strings_map):
+        # the same checks StringsMapSchema makes on a json index
+        from .schema import StringsMapSchema
+        errors = StringsMapSchema().validate(strings_map_to_dict(strings_map))
+        if errors:
+            raise Exception(f"invalid string index {self.path}: {errors}")
+
+    def load(self):
+        connection = self.connection
+        placeholders = {}
+        for index_id, key, position, placeholder in connection.execute('SELECT index_id, key, position, placeholder FROM placeholder'):
+            placeholders.setdefault((index_id, key), {})[position] = placeholder
+        keys = {}
+        for index_id, key, platform in connection.execute('SELECT index_id, key, platform FROM string_key ORDER BY index_id, position'):
+            keys.setdefault(index_id, []).append(StringKey(key, placeholders.get((index_id, key), {}), platform))
+        del placeholders
+        translations = {}
+        for index_id, language, value in connection.execute('SELECT index_id, language, value FROM translation'):
+            translations.setdefault(index_id, {})[language] = value
+
+        version = self.get_version()
+        # ordered by value to match the sorted keys of the json index
+        index = {}
+        self._rows = {}
+        for index_id, value, type, translatable in connection.execute('SELECT id, value, type, translatable FROM string_index ORDER BY value'):
+            string_index = StringIndex(
+                value,
+                type,
+                translatable=bool(translatable),
+                translations=translations.pop(index_id, {}),
+                keys=keys.pop(index_id, [])
+            )
+            index[value] = string_index
+            self._rows[value] = (index_id, (type, string_index.translatable), *_get_digests(string_index))
+        strings_map = StringsMap(index=index, version=version)
+        if self.validate:
+            self._validate(strings_map)
+        return strings_map
+
+    def get_version(self):
+        # a database from before the index was versioned reports 0
+        return self.connection.execute('PRAGMA user_version').fetchone()[0] or 1
+
+    def _load_indexes(self, condition, parameters):
+        # the string_index rows matching condition with their keys, placeholders and translations
+        connection = self.connection
+        indexes = []
+        rows = connection.execute(f'SELECT id, value, type, translatable FROM string_index WHERE {condition} ORDER BY value', parameters)
+        for index_id, value, type, translatable in rows.fetchall():
+            placeholders = {}
+            for key, position, placeholder in connection.execute('SELECT key, position, placeholder FROM placeholder WHERE index_id = ?', (index_id,)):
+                placeholders.setdefault(key, {})[position] = placeholder
+            keys = [
+                StringKey(key, placeholders.get(key, {}), platform)
+                for key, platform in connection.execute('SELECT key, platform FROM string_key WHERE index_id = ? ORDER BY position', (index_id,))
+            ]
+            translations = dict(connection.execute('SELECT language, value FROM translation WHERE index_id = ?', (index_id,)))
+            indexes.append(StringIndex(value, type, translatable=bool(translatable), translations=translations, keys=keys))
+        return indexes
+
+    def find_indexes_by_key(self, key):
+        return self._load_indexes('id IN (SELECT index_id FROM string_key WHERE key = ?)', (key,))
+
+    def find_index_by_value(self, value):
+        indexes = self._load_indexes('value = ?', (value,))
+        return indexes[0] if indexes else None
+
+    def find_translations_by_language(self, language):
+        # value -> translation of every string with a translation in language
+        return dict(self.connection.execute(
+            'SELECT string_index.value, translation.value FROM translation JOIN string_index ON string_index.id = translation.index_id WHERE translation.language = ?',
+            (language,)
+        ))
+
+    def save(self, strings_map):
+        # only rows that differ from the last load or save are written
+        if self.validate:
+            self._validate(strings_map)
+        connection = self.connection
+        rows = {}
+        with connection:
+            for value in self._rows.keys() - strings_map.index.keys():
+                connection.execute('DELETE FROM string_index WHERE id = ?', (self._rows[value][0],))
+
+            for value, string_index in strings_map.index.items():
+                attributes = (string_index.type, string_index.translatable)
+                keys_digest, translations_digest = _get_digests(string_index)
+                old_row = self._rows.get(value)
+                if old_row is None:
+                    index_id = connection.execute(
+                        'INSERT INTO string_index (value, type, translatable) VALUES (?, ?, ?)',
+                        (value, string_index.type, string_index.translatable)
+                    ).lastrowid
+                    self._insert_keys(index_id, _get_keys_row(string_index))
+                    self._insert_translations(index_id, string_index.translations)
+                else:
+                    index_id, old_attributes, old_keys_digest, old_translations_digest = old_row
+                    if attributes != old_attributes:
+                        connection.execute(
+                            'UPDATE string_index SET type = ?, translatable = ? WHERE id = ?',
+                            (string_index.type, string_index.translatable, index_id)
+                        )
+                    if keys_digest != old_keys_digest:
+                        connection.execute('DELETE FROM string_key WHERE index_id = ?', (index_id,))
+                        self._insert_keys(index_id, _get_keys_row(string_index))
+                    if translations_digest != old_translations_digest:
+                        connection.execute('DELETE FROM translation WHERE index_id = ?', (index_id,))
+                        self._insert_translations(index_id, string_index.translations)
+                rows[value] = (index_id, attributes, keys_digest, translations_digest)
+            if connection.execute('PRAGMA user_version').fetchone()[0] != strings_map.version:
+                connection.execute(f'PRAGMA user_version = {int(strings_map.version)}')
+        self._rows = rows
+
+    def _insert_keys(self, index_id, keys):
+        self.connection.executemany(
+            'INSERT INTO string_key (index_id, position, key, platform) VALUES (?, ?, ?, ?)',
+            [(index_id, position, key, platform) for position, (key, _, platform) in enumerate(keys)]
+        )
+        self.connection.executemany(
+            'INSERT INTO placeholder (index_id, key, position, placeholder) VALUES (?, ?, ?, ?)',
+            [
+                (index_id, key, position, placeholder)
+                for key, placeholder_map, _ in keys
+                for position, placeholder in placeholder_map
+            ]
+        )
+
+    def _insert_translations(self, index_id, translations):
+        self.connection.executemany(
+            'INSERT INTO translation (index_id, language, value) VALUES (?, ?, ?)',
+            [(index_id, language, value) for language, value in translations.items()]
+        )
+
+
+def get_storage(config, validate=False):
+    storage = config.get("storage", "json")
+    if storage == "json":
+        return JsonStorage(config.string_index_filename, validate)
+    elif storage == "sqlite":
+        return SqliteStorage(config.string_index_filename, validate)
+    else:
+        raise Exception(f"{storage} is not a supported storage")
@@ -1,58 +1,127 @@
-from lib2to3.pgen2.token import STRING
+from bisect import bisect_right
+from functools import lru_cache
 import os
-import traceback
 import re
+import sys
 
-from .utilities import get_generic_language, remove_files
+from .utilities import get_generic_language
+from .writer import write_file
 
 STRING_TYPE = 'string'
 PLURAL_TYPE = 'plural'
 
+# printf style placeholders: %[n$][flags][width][.precision][length]conversion, plus %@ and %%
+re_placeholder = re.compile(
+    r"%(?:\d+\$)?[-+#0']*(?:\d+|\*)?(?:\.(?:\d+|\*))?(?:hh|h|ll|l|L|q|j|z|t)?[diouxXfFeEgGaAcCsSp@]|%%"
+)
+re_template_placeholder = re.compile(r'\{(\d+)\}')
+PLACEHOLDER_CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=PLACEHOLDER_CACHE_SIZE)
+def parse_placeholders(value):
+    # "Hello %1$s" -> ("Hello {0}", ("%1$s",)), memoized since the same value shows up in many files
+    if not value or '%' not in value:
+        return value, ()
+    parts = []
+    placeholders = []
+    position = 0
+    for match in re_placeholder.finditer(value):
+        parts.append(value[position:match.start()])
+        parts.append('{' + f'{len(placeholders)}' + '}')
+        placeholders.append(match.group(0))
+        position = match.end()
+    parts.append(value[position:])
+    return "".join(parts), tuple(placeholders)
+
+
+@lru_cache(maxsize=PLACEHOLDER_CACHE_SIZE)
+def get_placeholder_template(parsed_value):
+    # "Hola {0}" -> ("Hola ", 0, ""): literals at even positions, placeholder indexes at odd ones
+    parts = []
+    position = 0
+    for match in re_template_placeholder.finditer(parsed_value):
+        parts.append(parsed_value[position:match.start()])
+        parts.append(int(match.group(1)))
+        position = match.end()
+    parts.append(parsed_value[position:])
+    return tuple(parts)
+
+
+def render_placeholders(parsed_value, placeholder_map):
+    if not parsed_value or not placeholder_map:
+        return parsed_value
+    parts = get_placeholder_template(parsed_value)
+    if len(parts) == 1:
+        return parsed_value
+    return "".join(
+        part if index % 2 == 0 else placeholder_map.get(part, '{' + f'{part}' + '}')
+        for index, part in enumerate(parts)
+    )
+
+
+# shared by every item without placeholders or tools attributes, never mutated
+EMPTY_MAP = {}
+
+
+@lru_cache(maxsize=PLACEHOLDER_CACHE_SIZE)
+def get_shared_placeholder_map(placeholders):
+    # items with the same placeholders share one map, so it must be treated as read only
+    return dict(enumerate(placeholders)) if placeholders else EMPTY_MAP
+
 
 class StringItem:
-    
-    def __init__(self, key, type, translatable=True, value=None, plural_items=None, comments=None):
-        self.key = key
+    # slots and interned keys keep the per item cost down, a catalog holds one of these per entry per locale
+    __slots__ = (
+        'key', 'value', 'parsed_value', 'placeholder_map', 'plural_items', 'type', 'translatable', 'translated',
+        'comments', 'tools_attributes',
+    )
+
+    def __init__(self, key, type, translatable=True, value=None, plural_items=None, comments=None, tools_attributes=None):
+        self.key = sys.intern(key) if key else key
         self.value = value
         self.parsed_value = ""  
-        self.placeholder_map = {}
-        self.plural_items = plural_items
+        self.placeholder_map = EMPTY_MAP
+        self.plural_items = tuple(plural_items) if plural_items is not None else None
         self.type = type
         self.translatable = translatable
         self.translated = False
-        self.comments = comments
+        self.comments = tuple(comments) if comments is not None else None
+        self.tools_attributes = tools_attributes if tools_attributes else EMPTY_MAP
         if type == STRING_TYPE:
             self._parse_value_for_placeholders()
 
     def _parse_value_for_placeholders(self):
-        # not an exaustive parser yet - handles only general use cases, no modifiers
-        regex = r'(\%[\d]\$[a-zAZ]|%l[dxui]|%zx|%[a-zAZ]|%[@%])'
-        edited_value = self.value
-        match = re.search(regex, edited_value)
-        index = 0
-        while match:
-            placeholder = '{' + f'{index}' + '}'
-            edited_value = placeholder.join([edited_value[:match.start()], edited_value[match.end():]])
-            self.placeholder_map[index] = match.group(0)
-            index += 1
-            match = re.search(regex, edited_value)
-        self.parsed_value = edited_value
+        self.parsed_value, placeholders = parse_placeholders(self.value)
+        self.placeholder_map = get_shared_placeholder_map(placeholders)
 
 
 class PluralItem:
+    __slots__ = ('quantity', 'quantity_value')
+
     def __init__(self, quantity, quantity_value):
-        self.quantity = quantity
+        self.quantity = sys.intern(quantity) if quantity else quantity
         self.quantity_value = quantity_value
 
 
 class StringFile:
+    platform = None
 
-    def __init__(self, filepath, language, default=False):
-        self.language = language
+    def __init__(self, filepath, language, default=False, values=None):
+        self.language = sys.intern(language)
         self.values = []
         self.filepath = filepath
         self.default = default
-        self._read_from_file()
+        self._sorted_values = None
+        # lowercase keys of _sorted_values in the same order, bisected when a key is inserted
+        self._sorted_keys = None
+        self._keys = None
+        # set when keys were added in memory and the file still has to be written
+        self.has_changes = False
+        if values is not None:
+            self.values = values
+        else:
+            self._read_from_file()
 
     def _read_from_file(self):
         # print('>>> Reading {}\npath: {}\n'.format(self.language, self.filepath))
@@ -62,6 +131,9 @@ class StringFile:
             with open(self.filepath, "w") as f:
                 f.write(self.empty_body)
         self.values = self.parse()
+        self._sorted_values = None
+        self._sorted_keys = None
+        self._keys = None
         # print('parsed {} items'.format(len(self.values)))
         # print('\n>>> Closing {}\n\n'.format(self.language))
 
@@ -71,7 +143,25 @@ class StringFile:
 
     @property
     def body(self):
-        raise NotImplementedError("body must be implemented")
+        return "".join(self.iter_body())
+
+    def iter_body(self):
+        raise NotImplementedError("iter_body must be implemented")
+
+    @property
+    def sorted_values(self):
+        # sorting is cached between renders; keys never change once parsed
+        if self._sorted_values is None or len(self._sorted_values) != len(self.values):
+            self._sorted_values = sorted(self.values, key=lambda x: x.key.lower())
+            self._sorted_keys = [value.key.lower() for value in self._sorted_values]
+        return self._sorted_values
+
+    @property
+    def keys(self):
+        # every key in the file, kept current by insert_new_string_key
+        if self._keys is None:
+            self._keys = {value.key for value in self.values}
+        return self._keys
 
     @property
     def footer(self):
@@ -84,6 +174,14 @@ class StringFile:
     def parse(self):
         raise NotImplementedError("parse must be implemented")
 
+    @staticmethod
+    def get_string_file_args(config):
+        raise NotImplementedError('get_string_file_args must be implemented')
+
+    @staticmethod
+    def get_string_dir_args(config, string_dir):
+        raise NotImplementedError('get_string_dir_args must be implemented')
+
     @staticmethod
     def get_string_files(config):
         raise NotImplementedError('get_string_files must be implemented')
@@ -92,52 +190,83 @@ class StringFile:
     def generic_language(self):
         return get_generic_language(self.language)
 
-    @staticmethod
-    def popuplate_with_new_keys(config):
-        raise NotImplementedError("popuplate_with_new_keys must be implemented")
+    def adapt_placeholder(self, placeholder):
+        return placeholder
+
+    def get_placeholder_map(self, string_key):
+        # keys are shared across platforms, so placeholders that come from another platform are converted to
+        # this file's style; keys of unknown platform are converted as well, as before platforms were recorded
+        if string_key.platform == self.platform:
+            return string_key.placeholder_map
+        return {index: self.adapt_placeholder(placeholder) for index, placeholder in string_key.placeholder_map.items()}
 
     def insert_new_string_key(self, key, default_value=""):
-        self.values.append(
-            StringItem(
-                key,
-                STRING_TYPE,
-                translatable=True,
-                value=default_value,
-            )
+        string_item = StringItem(
+            key,
+            STRING_TYPE,
+            translatable=True,
+            value=default_value,
+            comments=(),
         )
+        # the sorted view is kept sorted instead of being rebuilt on the next render
+        if self._sorted_values is not None:
+            position = bisect_right(self._sorted_keys, key.lower())
+            self._sorted_keys.insert(position, key.lower())
+            self._sorted_values.insert(position, string_item)
+        self.values.append(string_item)
+        if self._keys is not None:
+            self._keys.add(key)
+        self.has_changes = True
 
-    def update_values(self, map):
+    def update_values(self, map, writer=None):
         has_changes = False
         for value in list(filter(lambda v: v.translatable and v.type == STRING_TYPE, self.values)):
-            string_index_list = list(filter(lambda o: value.key in [k.key for k in o.keys], map.index.values()))
-            if string_index_list:
-                string_index = string_index_list[0]
+            string_index = map.find_index_by_key(value.key)
+            if string_index:
                 string_value = string_index.translations[self.generic_language]
-                string_key = next(filter(lambda k: value.key == k.key, string_index.keys))
-                for index, placeholder in string_key.placeholder_map.items():
-                    string_value = string_value.replace('{' + f'{index}' + '}', placeholder)
+                string_key = string_index.get_key(value.key)
+                string_value = render_placeholders(string_value, self.get_placeholder_map(string_key))
                 if string_value and string_value != value.value:
                     value.value = string_value
                     has_changes = True
         
-        if has_changes:
-            # todo: we may not need to do this check -- has issues with newly added keys
-            self.update_strings_file()
-
-    def update_strings_file(self):
-        try:
-            original = self.filepath
-            old = original + '.old'
-            new = original + '.new'
-            if os.path.isfile(original):
-                self.save_to_file(new)
-                os.rename(original, old)
-                os.rename(new, original)
-                remove_files([old, new])
-        except Exception as e:
-            print(e)
-            print(traceback.format_exc())
+        if has_changes or self.has_changes:
+            self.update_strings_file(writer)
+
+    def update_strings_file(self, writer=None):
+        # the file on disk is only replaced when the rendered content differs from it
+        if writer is None:
+            write_file(self.filepath, self.write)
+        else:
+            writer.write(self.filepath, self.write)
+        self.has_changes = False
+
+    def write(self, f):
+        f.write(self.header)
+        f.writelines(self.iter_body())
+        f.write(self.footer)
 
     def save_to_file(self, path):
-        with open(path, 'w') as f:
-            f.write(f'{self.header}{self.body}{self.footer}')
+        write_file(path, self.write)
+
+
+def propagate_keys(string_files):
+    # string_files belong to one string dir; translatable strings missing from a translation are copied
+    # from the default file so the key exists everywhere, returns the files that gained keys
+    default_file = next((string_file for string_file in string_files if string_file.default), None)
+    if default_file is None:
+        return []
+    default_values = {
+        value.key: value.value for value in default_file.values
+        if value.translatable and value.type == STRING_TYPE
+    }
+    populated_files = []
+    for string_file in string_files:
+        if string_file is default_file:
+            continue
+        missing_keys = default_values.keys() - string_file.keys
+        for key in sorted(missing_keys):
+            string_file.insert_new_string_key(key, default_values[key])
+        if missing_keys:
+            populated_files.append(string_file)
+    return populated_files
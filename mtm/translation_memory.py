@@ -0,0 +1,211 @@
+import hashlib
+import os
+import pickle
+import re
+import struct
+from functools import lru_cache
+
+from .output import echo
+from .strings import re_template_placeholder
+
+# bump whenever the signature layout below changes so stale files are rebuilt
+TM_VERSION = 1
+NGRAM_SIZE = 3
+# 8 bands of 4 minhashes put pairs above roughly 0.6 jaccard similarity in a shared bucket
+BANDS = 8
+ROWS = 4
+DEFAULT_THRESHOLD = 0.8
+
+re_whitespace = re.compile(r'\s+')
+# a 64 byte blake2b digest is read as 32 independent 16 bit hashes, one per minhash
+_HASHES = struct.Struct(f'<{BANDS * ROWS}H')
+
+
+def get_shingles(value):
+    # character trigrams of the lowercased value with collapsed whitespace, padded so word edges count
+    normalized = f' {re_whitespace.sub(" ", value.lower()).strip()} '
+    if len(normalized) <= NGRAM_SIZE:
+        return {normalized}
+    return {normalized[index:index + NGRAM_SIZE] for index in range(len(normalized) - NGRAM_SIZE + 1)}
+
+
+# trigrams repeat a lot across a catalog, so their hashes are worth keeping around
+@lru_cache(maxsize=1 << 13)
+def _get_shingle_hashes(shingle):
+    return _HASHES.unpack(hashlib.blake2b(shingle.encode('utf-8'), digest_size=64, person=b'mtm-tm').digest())
+
+
+def get_signature(shingles):
+    return tuple(map(min, zip(*map(_get_shingle_hashes, shingles))))
+
+
+def get_similarity(shingles, other_shingles, threshold=0.0):
+    # exact jaccard similarity, 0 when the sizes alone rule out reaching threshold
+    size, other_size = len(shingles), len(other_shingles)
+    if min(size, other_size) < threshold * max(size, other_size):
+        return 0.0
+    common = len(shingles & other_shingles)
+    return common / (size + other_size - common)
+
+
+def get_placeholder_signature(value):
+    return sorted(re_template_placeholder.findall(value))
+
+
+class TranslationMemory:
+    # minhash signatures of every source value in the index, bucketed per band so similar values are found
+    # without comparing against the whole catalog
+
+    def __init__(self, path=None):
+        self.path = path
+        # value -> minhash signature
+        self.signatures = {}
+        # (band, band hashes) -> values
+        self.buckets = {}
+        self.has_changes = False
+        self._shingles = {}
+        if path:
+            self._read_from_file()
+
+    def _read_from_file(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                version, parameters, signatures = pickle.load(f)
+        except Exception as e:
+            echo(f"!!! ignoring unreadable translation memory {self.path}: {e}")
+            return
+        if version == TM_VERSION and parameters == (NGRAM_SIZE, BANDS, ROWS):
+            for value, signature in signatures.items():
+                self._add_signature(value, signature)
+
+    def save(self):
+        if not self.has_changes or not self.path:
+            return
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump((TM_VERSION, (NGRAM_SIZE, BANDS, ROWS), self.signatures), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+        self.has_changes = False
+
+    def _get_bands(self, signature):
+        return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def _add_signature(self, value, signature):
+        self.signatures[value] = signature
+        for band in self._get_bands(signature):
+            self.buckets.setdefault(band, set()).add(value)
+
+    def _get_shingles(self, value):
+        shingles = self._shingles.get(value)
+        if shingles is None:
+            shingles = self._shingles[value] = get_shingles(value)
+        return shingles
+
+    def __contains__(self, value):
+        return value in self.signatures
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, value):
+        if value in self.signatures:
+            return False
+        self._add_signature(value, get_signature(self._get_shingles(value)))
+        self.has_changes = True
+        return True
+
+    def remove(self, value):
+        signature = self.signatures.pop(value, None)
+        if signature is None:
+            return False
+        for band in self._get_bands(signature):
+            values = self.buckets[band]
+            values.discard(value)
+            if not values:
+                del self.buckets[band]
+        self._shingles.pop(value, None)
+        self.has_changes = True
+        return True
+
+    def update(self, strings_map):
+        # only values new to the index are hashed, values that left it are dropped; returns the added values
+        removed_values = [value for value in self.signatures if value not in strings_map.index]
+        for value in removed_values:
+            self.remove(value)
+        return [value for value in strings_map.index if self.add(value)]
+
+    def get_candidates(self, value):
+        signature = self.signatures.get(value)
+        if signature is None:
+            signature = get_signature(self._get_shingles(value))
+        candidates = set()
+        for band in self._get_bands(signature):
+            candidates.update(self.buckets.get(band, ()))
+        candidates.discard(value)
+        return candidates
+
+    def find_similar(self, value, threshold=DEFAULT_THRESHOLD, limit=5):
+        # [(similarity, value)] best first, the similarity is the exact jaccard of the two values' trigrams
+        shingles = self._get_shingles(value)
+        similar = []
+        for candidate in self.get_candidates(value):
+            similarity = get_similarity(shingles, self._get_shingles(candidate), threshold)
+            if similarity >= threshold:
+                similar.append((similarity, candidate))
+        similar.sort(key=lambda item: (-item[0], item[1]))
+        return similar[:limit] if limit else similar
+
+    def get_clusters(self, threshold=DEFAULT_THRESHOLD):
+        # groups of near duplicate values, largest first; every pair is only compared if it shares a bucket
+        parents = {}
+
+        def find(value):
+            root = value
+            while parents.get(root, root) != root:
+                root = parents[root]
+            while value != root:
+                value, parents[value] = parents.get(value, value), root
+            return root
+
+        for value in self.signatures:
+            shingles = self._get_shingles(value)
+            for candidate in self.get_candidates(value):
+                if candidate < value or find(candidate) == find(value):
+                    continue
+                if get_similarity(shingles, self._get_shingles(candidate), threshold) >= threshold:
+                    parents[find(candidate)] = find(value)
+
+        clusters = {}
+        for value in list(parents):
+            clusters.setdefault(find(value), []).append(value)
+        for root, values in clusters.items():
+            if root not in values:
+                values.append(root)
+        return sorted((sorted(values) for values in clusters.values() if len(values) > 1), key=lambda values: (-len(values), values))
+
+
+def get_suggestions(strings_map, memory, values, languages, threshold=DEFAULT_THRESHOLD):
+    # {value: {language: (translation, similar value, similarity)}} for the untranslated languages of values,
+    # taken from the most similar translated value with the same placeholders. A translation that is just the
+    # source value, as propagated keys get, counts as untranslated like it does on the sheet
+    suggestions = {}
+    for value in values:
+        string_index = strings_map.index[value]
+        missing_languages = [language for language in languages if string_index.translations.get(language) in (None, "", value)]
+        if not missing_languages:
+            continue
+        placeholders = get_placeholder_signature(value)
+        for similarity, similar_value in memory.find_similar(value, threshold, limit=None):
+            similar_index = strings_map.index.get(similar_value)
+            if similar_index is None or get_placeholder_signature(similar_value) != placeholders:
+                continue
+            for language in list(missing_languages):
+                translation = similar_index.translations.get(language)
+                if translation and translation != similar_value and not similar_index.has_conflict(language):
+                    suggestions.setdefault(value, {})[language] = (translation, similar_value, similarity)
+                    missing_languages.remove(language)
+            if not missing_languages:
+                break
+    return suggestions
@@ -1,6 +1,25 @@
 import os
 import re
 
+
+class AttributeDict(dict):
+    # config objects read with json.loads(..., object_hook=AttributeDict) allow config.key access
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
 def remove_files(filepaths):
     for filepath in filepaths:
         if os.path.isfile(filepath):
@@ -0,0 +1,213 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from .manager import DEFAULT_CONFIG_PATH, Session
+from .output import echo
+from .writer import FileWriter
+
+POLL_INTERVAL = 0.05
+DEBOUNCE = 0.05
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+# editors either rewrite a file in place or rename a temp file over it, so both are watched
+INOTIFY_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def get_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class PollingMonitor:
+
+    def __init__(self, paths, interval=POLL_INTERVAL):
+        self.paths = set(paths)
+        self.interval = interval
+
+    def wait(self, timeout=None):
+        # every path is a candidate, the caller compares signatures to find the ones that changed
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        return set(self.paths)
+
+    def close(self):
+        pass
+
+
+class InotifyMonitor:
+    # the directories holding the string files are watched, so renames over a file are seen too
+
+    def __init__(self, paths):
+        self.paths = {os.path.normpath(path) for path in paths}
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        try:
+            for directory in sorted({os.path.dirname(path) or '.' for path in self.paths}):
+                descriptor = libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+                if descriptor < 0:
+                    raise OSError(ctypes.get_errno(), f"unable to watch {directory}")
+                self.directories[descriptor] = directory
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def wait(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        position = 0
+        while position < len(data):
+            descriptor, mask, _, length = INOTIFY_EVENT.unpack_from(data, position)
+            position += INOTIFY_EVENT.size
+            name = data[position:position + length].rstrip(b'\0')
+            position += length
+            if mask & IN_Q_OVERFLOW:
+                return set(self.paths)
+            directory = self.directories.get(descriptor)
+            if directory and name:
+                path = os.path.normpath(os.path.join(directory, os.fsdecode(name)))
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_monitor(paths, interval=POLL_INTERVAL):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyMonitor(paths)
+        except (OSError, AttributeError) as e:
+            echo(f"inotify is not available, polling instead: {e}")
+    return PollingMonitor(paths, interval)
+
+
+class Watcher:
+    # keeps the index and string files of a session in memory and applies edits to them one file at a time
+
+    def __init__(self, session, monitor=None, debounce=None):
+        self.session = session
+        self.debounce = debounce if debounce is not None else session.config.get("watch_debounce", DEBOUNCE)
+        self.paths = [string_file.filepath for string_file in session.string_files]
+        self.monitor = monitor if monitor else get_monitor(self.paths, session.config.get("watch_interval", POLL_INTERVAL))
+        self.signatures = {path: get_signature(path) for path in self.paths}
+        # files changed since the last flush, written out once edits have been quiet for the debounce time
+        self.changed_files = {}
+        self.last_change = None
+
+    def start(self):
+        session = self.session
+        session.backup()
+        echo("syncing string index with project strings")
+        session.map.sync(session.string_files, session.get_generic_languages())
+        session.has_changes = True
+        self.flush(session.string_files)
+
+    def check(self, paths):
+        for path in paths:
+            signature = get_signature(path)
+            if signature is None or signature == self.signatures.get(path):
+                continue
+            self.signatures[path] = signature
+            try:
+                string_file = self.session.reload_string_file(path)
+            except Exception as e:
+                # usually a file caught half way through a save, the next event picks it up again
+                echo(f"!!! unable to reload {path}: {e}")
+                if not self.session._is_map_consistent:
+                    self.reset_map()
+                continue
+            echo(f"reloaded {path}")
+            self.changed_files[path] = string_file
+            self.last_change = time.monotonic()
+
+    def reset_map(self):
+        # a sync that failed part way is not persisted: the map is read again from the index, which holds
+        # everything up to the last flush, and the files reloaded since then are synced into it again
+        session = self.session
+        session.reload_map()
+        session._set_source("files")
+        try:
+            session.map.sync(list(self.changed_files.values()), session.get_generic_languages())
+            session.has_changes = bool(self.changed_files)
+        except Exception as e:
+            echo(f"!!! unable to sync the files changed since the last save, they are left out of the index: {e}")
+            session.reload_map()
+            self.changed_files = {}
+            self.last_change = None
+
+    def get_affected_files(self):
+        # an edited translation can change the same value in other files of that language, files that
+        # gain keys from an edited default file are added by the save itself
+        languages = {string_file.generic_language for string_file in self.changed_files.values() if not string_file.default}
+        return [
+            string_file for string_file in self.session.string_files
+            if string_file.filepath in self.changed_files
+            or (not string_file.default and string_file.generic_language in languages)
+        ]
+
+    def flush(self, string_files=None):
+        session = self.session
+        session.writer = FileWriter(session.config.get("fsync", False))
+        try:
+            session.save(string_files if string_files is not None else self.get_affected_files())
+        except Exception as e:
+            echo(e)
+        finally:
+            session.writer.discard()
+        # as in Session.run, a map left half applied is never written to the index or the journal
+        if session._is_map_consistent:
+            session.persist()
+        else:
+            self.reset_map()
+        for path in session.writer.written:
+            self.signatures[path] = get_signature(path)
+        if session.writer.written:
+            session.writer.report()
+        self.changed_files = {}
+        self.last_change = None
+
+    def run(self):
+        self.start()
+        echo(f"watching {len(self.paths)} string files, press ctrl+c to stop")
+        try:
+            while True:
+                timeout = None
+                if self.last_change is not None:
+                    timeout = max(0, self.last_change + self.debounce - time.monotonic())
+                self.check(self.monitor.wait(timeout))
+                if self.last_change is not None and time.monotonic() - self.last_change >= self.debounce:
+                    self.flush()
+        except KeyboardInterrupt:
+            echo("stopped watching")
+        finally:
+            if self.changed_files:
+                self.flush()
+            self.monitor.close()
+
+
+def watch(config_path=DEFAULT_CONFIG_PATH, validate=False):
+    Watcher(Session(config_path, validate)).run()
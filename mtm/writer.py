@@ -0,0 +1,231 @@
+import hashlib
+import io
+import os
+import stat
+import tempfile
+import threading
+from contextlib import ExitStack
+
+from . import instrumentation
+from .output import echo
+
+READ_CHUNK_SIZE = 1 << 16
+
+
+def get_file_digest(path):
+    hash = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            hash.update(chunk)
+    return hash.digest()
+
+
+def _read_umask():
+    # linux reports the umask without changing it; elsewhere it can only be read by setting it, which is done
+    # once here at import, before a batch has threads creating files
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+NEW_FILE_MODE = 0o666 & ~_read_umask()
+
+
+def _fsync_path(path, flags=os.O_RDONLY):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _DigestSink(io.RawIOBase):
+    # passes bytes through to f while hashing them, so a streamed file can be compared with the one on disk
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.blake2b()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+
+class PathLocks:
+    # one lock per real path, shared by the writers of a batch so projects that include the same file take
+    # turns replacing it
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def hold(self, paths):
+        # locks are taken in sorted order so two writers flushing overlapping files can not deadlock
+        stack = ExitStack()
+        for path in sorted({os.path.realpath(path) for path in paths}):
+            stack.enter_context(self.get(path))
+        return stack
+
+
+class FileWriter:
+    # files are rendered in memory and only replaced when their content changed, through a temp file in
+    # the same directory so a crash never leaves a half written file behind
+
+    def __init__(self, fsync=False, path_locks=None):
+        self.fsync = fsync
+        self.path_locks = path_locks
+        self.written = []
+        self.unchanged = []
+        # (temp path, path, digest of the content) waiting for flush()
+        self._pending = []
+
+    def is_unchanged(self, path, data):
+        try:
+            if os.path.getsize(path) != len(data):
+                return False
+            return get_file_digest(path) == hashlib.blake2b(data).digest()
+        except OSError:
+            return False
+
+    def write(self, path, render, encoding='utf-8', stream=False):
+        # render(f) writes the text of the file to f; returns True when the file will be replaced.
+        # With stream the text goes to the temp file in chunks as it is rendered, so a file as large as the
+        # index is never held in memory whole
+        if stream:
+            return self._write_stream(path, render, encoding)
+        buffer = io.StringIO()
+        render(buffer)
+        data = buffer.getvalue().encode(encoding)
+        if self.is_unchanged(path, data):
+            self._add_unchanged(path)
+            return False
+
+        fd, temp_path = self._make_temp_file(path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self._set_mode(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._add_pending(temp_path, path, hashlib.blake2b(data).digest(), len(data))
+        return True
+
+    def _write_stream(self, path, render, encoding):
+        fd, temp_path = self._make_temp_file(path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                sink = _DigestSink(f)
+                text = io.TextIOWrapper(io.BufferedWriter(sink, READ_CHUNK_SIZE), encoding=encoding, newline='')
+                render(text)
+                text.flush()
+                text.detach()
+            digest = sink.hash.digest()
+            if self._has_digest(path, digest, sink.size):
+                os.remove(temp_path)
+                self._add_unchanged(path)
+                return False
+            self._set_mode(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._add_pending(temp_path, path, digest, sink.size)
+        return True
+
+    def _make_temp_file(self, path):
+        directory = os.path.dirname(path) or '.'
+        return tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+
+    def _set_mode(self, temp_path, path):
+        mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else NEW_FILE_MODE
+        os.chmod(temp_path, mode)
+
+    def _add_unchanged(self, path):
+        self.unchanged.append(path)
+        instrumentation.count("files.unchanged")
+
+    def _add_pending(self, temp_path, path, digest, size):
+        self._pending.append((temp_path, path, digest))
+        instrumentation.count("files.written")
+        instrumentation.count("bytes.written", size)
+
+    def flush(self):
+        # with fsync every temp file is synced before any of them replaces its original, then each
+        # directory is synced once, so the cost is one pass per batch instead of one per file
+        if self.path_locks is None or not self._pending:
+            return self._flush()
+        with self.path_locks.hold(path for _, path, _ in self._pending):
+            return self._flush()
+
+    def _flush(self):
+        pending = self._pending
+        self._pending = []
+        replaced = []
+        try:
+            if self.fsync:
+                for temp_path, _, _ in pending:
+                    _fsync_path(temp_path)
+            while pending:
+                temp_path, path, digest = pending[0]
+                if self.path_locks is not None and self._has_digest(path, digest):
+                    # another writer of the batch replaced it with the same content in the meantime
+                    os.remove(temp_path)
+                    pending.pop(0)
+                    self.unchanged.append(path)
+                    continue
+                os.replace(temp_path, path)
+                pending.pop(0)
+                replaced.append(path)
+            if self.fsync and hasattr(os, 'O_DIRECTORY'):
+                for directory in sorted({os.path.dirname(path) or '.' for path in replaced}):
+                    _fsync_path(directory, os.O_RDONLY | os.O_DIRECTORY)
+        finally:
+            self.written.extend(replaced)
+            for temp_path, _, _ in pending:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def _has_digest(self, path, digest, size=None):
+        try:
+            if size is not None and os.path.getsize(path) != size:
+                return False
+            return get_file_digest(path) == digest
+        except OSError:
+            return False
+
+    def discard(self):
+        # drops renders that were never flushed, e.g. after a stage failed half way
+        for temp_path, _, _ in self._pending:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._pending = []
+
+    def report(self):
+        for path in self.written:
+            echo(f"wrote {path}")
+        echo(f"{len(self.written)} files written, {len(self.unchanged)} unchanged")
+
+
+def write_file(path, render, fsync=False, stream=False):
+    # one off atomic write for callers without a session wide writer
+    writer = FileWriter(fsync)
+    changed = writer.write(path, render, stream=stream)
+    writer.flush()
+    return changed
@@ -10,11 +10,9 @@ setup(
     keywords='translations localizations android ios manager manage simplify simple strings string language languages app apps applicaiton applications',
     url='https://github.com/sethwhite2/mobile-translation-manager',
     license="MIT",
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     install_requires=[
-        'beautifulsoup4',
         'lxml',
-        'munch',
         'marshmallow',
         'gspread',
     ]
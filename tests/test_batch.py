@@ -0,0 +1,52 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from mtm.output import capture, echo
+from mtm.writer import FileWriter, PathLocks
+
+
+class OutputTest(unittest.TestCase):
+
+    def test_each_thread_captures_its_own_output(self):
+        stdout = sys.stdout
+        buffers = [io.StringIO() for _ in range(4)]
+        barrier = threading.Barrier(len(buffers))
+
+        def run(position):
+            with capture(buffers[position]):
+                barrier.wait()
+                for _ in range(50):
+                    echo(f"project {position}")
+
+        threads = [threading.Thread(target=run, args=(position,)) for position in range(len(buffers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIs(sys.stdout, stdout)
+        for position, buffer in enumerate(buffers):
+            self.assertEqual(buffer.getvalue(), f"project {position}\n" * 50)
+
+
+class PathLocksTest(unittest.TestCase):
+
+    def test_same_content_is_replaced_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "strings.xml")
+            path_locks = PathLocks()
+            writers = [FileWriter(path_locks=path_locks) for _ in range(2)]
+            for writer in writers:
+                self.assertTrue(writer.write(path, lambda f: f.write("<resources/>\n")))
+            for writer in writers:
+                writer.flush()
+            self.assertEqual([writer.written for writer in writers], [[path], []])
+            self.assertEqual(writers[1].unchanged, [path])
+            self.assertEqual(os.listdir(directory), ["strings.xml"])
+
+
+if __name__ == "__main__":
+    unittest.main()
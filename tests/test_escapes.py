@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import unittest
+
+from mtm import manager
+from mtm.android import AndroidStringFile
+from mtm.ios import iOSStringFile
+from mtm.sheets import LocalWorksheet
+from mtm.strings import PLURAL_TYPE, STRING_TYPE, PluralItem, StringItem
+
+VALUES = [
+    "l'application",
+    'It\'s "quoted"',
+    '"',
+    "'",
+    "a & b <c>",
+    "line\\nbreak",
+    "back\\\\slash",
+    "%1$s won't %2$d",
+]
+
+
+def write_and_parse(string_file_class, path, values):
+    items = [StringItem(f"key_{position}", STRING_TYPE, value=value, comments=[]) for position, value in enumerate(values)]
+    string_file_class(path, "en", True, values=items).save_to_file(path)
+    return {item.key: item.value for item in string_file_class(path, "en", True).values}
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def assert_round_trip(self, string_file_class, filename):
+        path = os.path.join(self.directory.name, filename)
+        parsed = write_and_parse(string_file_class, path, VALUES)
+        self.assertEqual(parsed, {f"key_{position}": value for position, value in enumerate(VALUES)})
+
+    def test_android(self):
+        self.assert_round_trip(AndroidStringFile, "strings.xml")
+
+    def test_android_plurals(self):
+        path = os.path.join(self.directory.name, "strings.xml")
+        plural = StringItem("items", PLURAL_TYPE, plural_items=[PluralItem("one", "l'item"), PluralItem("other", "%d items'")])
+        AndroidStringFile(path, "en", True, values=[plural]).save_to_file(path)
+        parsed = AndroidStringFile(path, "en", True).values[0]
+        self.assertEqual([item.quantity_value for item in parsed.plural_items], ["l'item", "%d items'"])
+
+    def test_ios(self):
+        self.assert_round_trip(iOSStringFile, "Localizable.strings")
+
+    def test_escaped_files_read_unescaped(self):
+        path = os.path.join(self.directory.name, "Localizable.strings")
+        with open(path, "w") as f:
+            f.write('"a" = "Say \\"hi\\"";\n"b" = "It\\\'s";\n')
+        self.assertEqual([item.value for item in iOSStringFile(path, "en", True).values], ['Say "hi"', "It's"])
+
+
+class SyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        self.addCleanup(os.chdir, cwd)
+        for language, value in (("", "open the app"), ("-fr", "open the app")):
+            os.makedirs(f"res/values{language}")
+            with open(f"res/values{language}/strings.xml", "w") as f:
+                f.write(f'<resources>\n    <string name="open">{value}</string>\n</resources>\n')
+        with open("config.json", "w") as f:
+            json.dump({
+                "string_index_filename": "string_index.json",
+                "sheets_api": {"spreadsheet_id": "local"},
+                "applications": [{
+                    "platform": "android", "project_dir": ".", "strings_filename": "strings.xml",
+                    "languages": ["", "fr"], "default_language": "", "string_dirs": ["res/values"],
+                }],
+            }, f)
+
+    def test_apostrophe_survives_save_and_sync(self):
+        manager.init("config.json")
+        session = manager.Session("config.json", worksheet=LocalWorksheet())
+        session.map.set_translation("open the app", "fr", "ouvrir l'application")
+        session.has_changes = True
+        session.run("save")
+        with open("res/values-fr/strings.xml") as f:
+            self.assertIn("ouvrir l\\'application", f.read())
+
+        session = manager.Session("config.json", worksheet=LocalWorksheet()).run("sync", "save")
+        self.assertEqual(session.map.index["open the app"].translations["fr"], "ouvrir l'application")
+        self.assertFalse(session.map.has_conflicts())
+
+
+if __name__ == "__main__":
+    unittest.main()
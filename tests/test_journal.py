@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from mtm.journal import Journal
+from mtm.map import StringIndex, StringKey, StringsMap
+from mtm.strings import STRING_TYPE
+
+
+class TornTailTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal = Journal(os.path.join(directory.name, "string_index.json"))
+        string_index = StringIndex("Open", STRING_TYPE, translations={"fr": "Ouvrir", "de": ""}, keys=[StringKey("open", {}, "android")])
+        self.strings_map = StringsMap(index={"Open": string_index})
+        self.strings_map.journal = self.journal
+        self.journal.checkpoint(self.strings_map, "init")
+
+    def commit(self, language, translation):
+        self.strings_map.set_translation("Open", language, translation)
+        return self.journal.commit()
+
+    def tear_tail(self, language, translation):
+        # appends a commit and cuts its commit line off, as a crash half way through the append would
+        with open(self.journal.path, 'rb') as f:
+            size = len(f.read())
+        last_commit = self.journal.get_last_commit()
+        self.commit(language, translation)
+        with open(self.journal.path, 'rb') as f:
+            lines = f.read()[size:].splitlines(keepends=True)
+        with open(self.journal.path, 'rb+') as f:
+            f.truncate(size + sum(len(line) for line in lines[:-1]))
+            f.seek(0, os.SEEK_END)
+            f.write(b'{"commit": 99, "op": "transl')
+        self.journal._last_commit = None
+        self.assertEqual(self.journal.get_last_commit(), last_commit)
+
+    def read_lines(self):
+        with open(self.journal.path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_torn_tail_is_dropped_by_the_next_commit(self):
+        self.commit("fr", "Ouvrir l'app")
+        self.tear_tail("de", "Öffnen")
+        self.assertEqual(self.commit("fr", "Lancer"), 3)
+        self.assertEqual([line["commit"] for line in self.read_lines()], [1, 2, 2, 3, 3])
+        restored = self.journal.restore()
+        self.assertEqual(restored.index["Open"].translations, {"fr": "Lancer", "de": ""})
+        self.assertEqual(self.journal.restore(2).index["Open"].translations, {"fr": "Ouvrir l'app", "de": ""})
+
+    def test_torn_tail_longer_than_a_chunk(self):
+        self.commit("fr", "Ouvrir l'app")
+        with mock.patch("mtm.journal.TAIL_SIZE", 16):
+            self.tear_tail("de", "Öffnen")
+            self.commit("fr", "Lancer")
+        self.assertEqual([line["commit"] for line in self.read_lines()], [1, 2, 2, 3, 3])
+        self.assertEqual(self.journal.restore().index["Open"].translations, {"fr": "Lancer", "de": ""})
+
+    def test_restore_skips_records_committed_under_a_later_number(self):
+        # a journal torn before appends truncated it, the orphaned record took the next commit's number
+        self.tear_tail("de", "Öffnen")
+        with open(self.journal.path, 'rb+') as f:
+            data = f.read()
+            f.seek(0)
+            f.truncate()
+            f.write(data[:data.rindex(b"\n") + 1])
+        self.strings_map.set_translation("Open", "fr", "Lancer")
+        with open(self.journal.path, 'a', encoding='utf-8') as f:
+            for record in self.journal.records:
+                f.write(json.dumps({"commit": 2, **record}, ensure_ascii=False) + "\n")
+            f.write(json.dumps({"op": "commit", "commit": 2, "time": 0, "records": 1, "pending": 1}) + "\n")
+        self.journal.records = []
+        self.journal._last_commit = None
+        self.assertEqual(self.journal.restore().index["Open"].translations, {"fr": "Lancer", "de": ""})
@@ -0,0 +1,19 @@
+import unittest
+
+from mtm.lint import lint_index
+from mtm.map import StringIndex, StringKey, StringsMap
+from mtm.strings import STRING_TYPE
+
+
+class LintIndexTest(unittest.TestCase):
+
+    def test_source_values_are_untranslated(self):
+        string_index = StringIndex(
+            "Open", STRING_TYPE, translations={"fr": "Open", "de": "", "es": "Abrir"}, keys=[StringKey("open", {})]
+        )
+        issues = lint_index(StringsMap(index={"Open": string_index}), ["fr", "de", "es"])
+        self.assertEqual([(issue.check, issue.languages) for issue in issues], [("untranslated", ["fr", "de"])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from mtm import manager
+from mtm.map import StringsMap, strings_map_to_dict
+from mtm.output import capture
+from mtm.sheets import LocalWorksheet
+
+ANDROID_STRINGS = {
+    "a/res/values": {"": {"open": "open the app", "close": "close"}, "fr": {"open": "ouvrir", "close": "fermer"}},
+    "b/res/values": {"": {"launch": "open the app", "quit": "close"}, "fr": {"launch": "lancer", "quit": "fermer"}},
+}
+IOS_STRINGS = {
+    "en": {"open": "open the app", "save": "save %@"},
+    "fr": {"open": "ouvrir l'app", "save": "enregistrer %@"},
+}
+
+
+class PartialMapTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+        for string_dir, languages in ANDROID_STRINGS.items():
+            for language, values in languages.items():
+                path = f"{string_dir}-{language}" if language else string_dir
+                os.makedirs(path)
+                with open(f"{path}/strings.xml", "w") as f:
+                    f.write("<resources>\n")
+                    for key, value in values.items():
+                        f.write(f'    <string name="{key}">{value}</string>\n')
+                    f.write("</resources>\n")
+        for language, values in IOS_STRINGS.items():
+            os.makedirs(f"ios/{language}.lproj")
+            with open(f"ios/{language}.lproj/Localizable.strings", "w") as f:
+                for key, value in values.items():
+                    f.write(f'"{key}" = "{value}";\n')
+        with open("config.json", "w") as f:
+            json.dump({
+                "string_index_filename": "string_index.json",
+                "sheets_api": {"spreadsheet_id": "local"},
+                "workers": 2,
+                "executor": "process",
+                "applications": [{
+                    "platform": "android", "project_dir": ".", "strings_filename": "strings.xml",
+                    "languages": ["", "fr"], "default_language": "", "string_dirs": list(ANDROID_STRINGS),
+                }, {
+                    "platform": "ios", "project_dir": ".", "strings_filename": "Localizable.strings",
+                    "languages": ["en", "fr"], "default_language": "en", "string_dirs": ["ios"],
+                }],
+            }, f)
+        self.output = capture(io.StringIO())
+        self.output.__enter__()
+        self.addCleanup(self.output.__exit__, None, None, None)
+        self.config = manager.get_config("config.json")
+        self.languages = manager._get_generic_languages(self.config, False)
+
+    def get_groups(self):
+        return manager._get_string_dir_groups(self.config, manager._get_string_files(self.config, {}))
+
+    def get_sequential_map(self):
+        map = StringsMap()
+        map.sync([string_file for group in self.get_groups() for string_file in group], self.languages)
+        return strings_map_to_dict(map)
+
+    def test_merged_partial_maps_match_a_sequential_sync(self):
+        expected = self.get_sequential_map()
+        partial_maps = [StringsMap.from_files(group, self.languages) for group in self.get_groups()]
+        map = manager._merge_partial_maps(StringsMap(), partial_maps)
+        # the same value under keys of different string dirs and platforms, with translations that conflict
+        self.assertGreater(map.conflict_count, 0)
+        self.assertEqual(strings_map_to_dict(map), expected)
+
+    def test_merge_is_associative(self):
+        expected = self.get_sequential_map()
+        first, second, third = [StringsMap.from_files(group, self.languages) for group in self.get_groups()]
+        merged = first.merge(second.merge(third))
+        merged.apply_pending()
+        self.assertEqual(strings_map_to_dict(merged), expected)
+
+    def test_worker_maps_match_a_sequential_sync(self):
+        expected = self.get_sequential_map()
+        _, partial_maps = manager._load_partial_maps(self.config, self.languages, cache={})
+        self.assertEqual(strings_map_to_dict(manager._merge_partial_maps(StringsMap(), partial_maps)), expected)
+
+    def test_partial_maps_are_built_only_by_sync(self):
+        # a sync refuses to write files while translations conflict
+        for path in ("b/res/values-fr/strings.xml", "ios/fr.lproj/Localizable.strings"):
+            with open(path) as f:
+                text = f.read()
+            with open(path, "w") as f:
+                f.write(text.replace("lancer", "ouvrir").replace("ouvrir l'app", "ouvrir"))
+        manager.init("config.json")
+        with mock.patch.object(manager, "_load_partial_maps", wraps=manager._load_partial_maps) as load_partial_maps:
+            manager.lint("config.json")
+            load_partial_maps.assert_not_called()
+            session = manager.Session("config.json", worksheet=LocalWorksheet())
+            session.run("sync")
+            load_partial_maps.assert_called_once()
+        self.assertEqual(strings_map_to_dict(session.map), self.get_sequential_map())
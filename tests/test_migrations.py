@@ -0,0 +1,85 @@
+import unittest
+
+from mtm.android import AndroidStringFile
+from mtm.ios import iOSStringFile
+from mtm.map import INDEX_VERSION, StringIndex, StringKey, StringsMap
+from mtm.migrations import migrate
+from mtm.strings import STRING_TYPE
+
+
+def get_map(*string_indexes, version=1):
+    return StringsMap(index={string_index.value: string_index for string_index in string_indexes}, version=version)
+
+
+class MigrationTest(unittest.TestCase):
+
+    def test_placeholders_are_parsed_again(self):
+        # "%1$@" and "%.2f" were not placeholders for the first release, "%d" was
+        string_index = StringIndex(
+            "%1$@ paid {0}",
+            STRING_TYPE,
+            translations={"fr": "%1$@ a payé {0}", "de": "~fuzzy; %1$@ zahlte {0}|{0} von %1$@"},
+            keys=[StringKey("paid", {0: "%.2f"})]
+        )
+        strings_map = migrate(get_map(string_index, version=2), {"ios"})
+        self.assertEqual(strings_map.version, INDEX_VERSION)
+        migrated = strings_map.index["{0} paid {1}"]
+        self.assertEqual(dict(migrated.keys[0].placeholder_map), {0: "%1$@", 1: "%.2f"})
+        self.assertEqual(migrated.translations["fr"], "{0} a payé {1}")
+        self.assertEqual(migrated.conflicts, {"de": ["{0} zahlte {1}", "{0} von {1}"]})
+
+    def test_values_that_parse_the_same_are_merged(self):
+        # android "%1$s" was a placeholder and ios "%1$@" was not, so the two keys had values of their own
+        android = StringIndex("{0} left", STRING_TYPE, translations={"fr": "", "de": "{0} weg"}, keys=[StringKey("left", {0: "%1$s"})])
+        ios = StringIndex("%1$@ left", STRING_TYPE, translations={"fr": "%1$@ parti", "de": "~fuzzy; %1$@ weg|{0} weg"}, keys=[StringKey("left_ios", {})])
+        strings_map = migrate(get_map(android, ios, version=2), {"android", "ios"})
+        self.assertEqual(list(strings_map.index), ["{0} left"])
+        merged = strings_map.index["{0} left"]
+        self.assertEqual([string_key.key for string_key in merged.keys], ["left", "left_ios"])
+        self.assertEqual(merged.translations, {"fr": "{0} parti", "de": "{0} weg"})
+        self.assertFalse(strings_map.has_conflicts())
+
+    def test_escaped_values_are_unescaped(self):
+        string_index = StringIndex(
+            "it\\'s", STRING_TYPE, translations={"fr": "c\\'est", "de": "~fuzzy; a\\'b|c"}, keys=[StringKey("key", {})]
+        )
+        strings_map = migrate(get_map(string_index), {"android"})
+        self.assertEqual(list(strings_map.index), ["it's"])
+        self.assertEqual(strings_map.index["it's"].translations, {"fr": "c'est", "de": "~fuzzy; a'b|c"})
+        self.assertEqual(strings_map.index["it's"].conflicts, {"de": ["a'b", "c"]})
+
+    def test_android_keeps_escaped_quotes(self):
+        string_index = StringIndex('say \\"hi\\"', STRING_TYPE, translations={}, keys=[StringKey("key", {})])
+        strings_map = migrate(get_map(string_index), {"android", "ios"})
+        self.assertEqual(list(strings_map.index), ['say \\"hi\\"'])
+        strings_map = migrate(get_map(string_index), {"ios"})
+        self.assertEqual(list(strings_map.index), ['say "hi"'])
+
+    def test_single_platform_keys_record_it(self):
+        string_index = StringIndex("{0} left", STRING_TYPE, translations={}, keys=[StringKey("left", {0: "%s"})])
+        strings_map = migrate(get_map(string_index, version=3), {"ios"})
+        self.assertEqual(strings_map.index["{0} left"].keys[0].platform, "ios")
+        string_index = StringIndex("{0} left", STRING_TYPE, translations={}, keys=[StringKey("left", {0: "%s"})])
+        strings_map = migrate(get_map(string_index, version=3), {"android", "ios"})
+        self.assertIsNone(strings_map.index["{0} left"].keys[0].platform)
+
+
+class PlaceholderMapTest(unittest.TestCase):
+
+    def test_placeholders_of_the_same_platform_are_kept(self):
+        ios_file = iOSStringFile("Localizable.strings", "en", True, values=[])
+        self.assertEqual(ios_file.get_placeholder_map(StringKey("name", {0: "%s", 1: "%@"}, "ios")), {0: "%s", 1: "%@"})
+        self.assertEqual(ios_file.get_placeholder_map(StringKey("name", {0: "%1$s"}, "android")), {0: "%1$@"})
+
+    def test_keys_fill_in_their_platform(self):
+        string_index = StringIndex("{0} left", STRING_TYPE, key="left", placeholder_map={0: "%s"})
+        self.assertFalse(string_index.fill_platform(StringKey("left", {0: "%@"}, "ios")))
+        self.assertTrue(string_index.fill_platform(StringKey("left", {0: "%s"}, "ios")))
+        self.assertFalse(string_index.fill_platform(StringKey("left", {0: "%s"}, "android")))
+        self.assertEqual(string_index.keys[0].platform, "ios")
+        android_file = AndroidStringFile("strings.xml", "en", True, values=[])
+        self.assertEqual(android_file.get_placeholder_map(string_index.keys[0]), {0: "%s"})
+
+
+if __name__ == "__main__":
+    unittest.main()
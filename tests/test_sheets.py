@@ -0,0 +1,101 @@
+import unittest
+from unittest import mock
+
+from mtm import sheets
+from mtm.map import StringIndex, StringKey, StringsMap
+from mtm.sheets import LocalWorksheet, get_sheet_rows, upload_to_google_sheet
+from mtm.strings import STRING_TYPE
+
+
+def get_map(translations):
+    # value -> {language: translation}
+    return StringsMap(index={
+        value: StringIndex(value, STRING_TYPE, translations=dict(value_translations), keys=[StringKey(value.lower(), {})])
+        for value, value_translations in translations.items()
+    })
+
+
+class ApplyTableTest(unittest.TestCase):
+
+    def test_rows_are_applied_once_the_index_changes(self):
+        strings_map = StringsMap(index={"open": StringIndex("open", STRING_TYPE, key="open", languages=["fr"])})
+        row_hashes = {}
+        # a blank cell fills the index with the source value, so the row is not recorded yet
+        strings_map.apply_table(["en", "fr"], [["open", ""]], row_hashes)
+        self.assertEqual(strings_map.index["open"].translations["fr"], "open")
+        self.assertEqual(row_hashes, {})
+        summary = strings_map.apply_table(["en", "fr"], [["open", ""]], row_hashes)
+        self.assertEqual(summary["updated_cells"], 0)
+        self.assertIn("open", row_hashes)
+        self.assertEqual(strings_map.apply_table(["en", "fr"], [["open", ""]], row_hashes)["unchanged_rows"], 1)
+
+        summary = strings_map.apply_table(["en", "fr"], [["open", "ouvrir"]], row_hashes)
+        self.assertEqual(summary["updated_cells"], 1)
+        self.assertEqual(strings_map.index["open"].translations["fr"], "ouvrir")
+
+        # the index changing under an unchanged row applies the row again
+        strings_map.apply_table(["en", "fr"], [["open", "ouvrir"]], row_hashes)
+        strings_map.index["open"].translations["fr"] = ""
+        summary = strings_map.apply_table(["en", "fr"], [["open", "ouvrir"]], row_hashes)
+        self.assertEqual((summary["unchanged_rows"], summary["updated_cells"]), (0, 1))
+
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strings_map = get_map({
+            "Open": {"fr": "Ouvrir", "de": "Öffnen"},
+            "Close": {"fr": "Fermer", "de": "Close"},
+        })
+
+    def upload(self, worksheet, base_values=None):
+        with mock.patch.object(sheets, "echo"):
+            return upload_to_google_sheet("local", self.strings_map, ["fr", "de"], base_values, worksheet)
+
+    def test_only_changed_cells_are_sent(self):
+        worksheet = LocalWorksheet(get_sheet_rows(self.strings_map, ["fr", "de"]))
+        self.assertEqual(self.upload(worksheet)["updated_cells"], 0)
+        self.assertEqual(worksheet.requests, [])
+
+        self.strings_map.set_translation("Close", "de", "Schließen")
+        summary = self.upload(worksheet)
+        self.assertEqual((summary["updated_cells"], summary["requests"]), (1, 1))
+        self.assertEqual(worksheet.requests, [[{"range": "C3:C3", "values": [["Schließen"]]}]])
+
+    def test_rows_keep_their_place_on_the_sheet(self):
+        worksheet = LocalWorksheet([["en", "fr", "de"], ["Close", "Fermer", ""], ["Open", "Ouvrir", "Öffnen"]])
+        self.strings_map.add_index(StringIndex("Save", STRING_TYPE, translations={"fr": "Enregistrer", "de": ""}, keys=[StringKey("save", {})]))
+        self.upload(worksheet)
+        self.assertEqual(worksheet.get_all_values(), [
+            ["en", "fr", "de"],
+            ["Close", "Fermer", ""],
+            ["Open", "Ouvrir", "Öffnen"],
+            ["Save", "Enregistrer", ""],
+        ])
+
+    def test_cells_edited_on_the_sheet_are_kept(self):
+        base_values = get_sheet_rows(self.strings_map, ["fr", "de"])
+        worksheet = LocalWorksheet(base_values)
+        # a translator fixes a cell after the sync read the sheet, the index changes another one
+        worksheet.batch_update([{"range": "B2", "values": [["Ouvrir!"]]}])
+        self.strings_map.set_translation("Close", "fr", "Fermer!")
+        summary = self.upload(worksheet, base_values)
+        self.assertEqual((summary["updated_cells"], summary["kept_edits"]), (1, 1))
+        self.assertEqual(worksheet.get_all_values()[1:], [["Open", "Ouvrir!", "Öffnen"], ["Close", "Fermer!", ""]])
+
+    def test_large_uploads_are_split_into_batches(self):
+        worksheet = LocalWorksheet()
+        with mock.patch.object(sheets, "MAX_BATCH_CELLS", 4), mock.patch.object(sheets, "MAX_BATCH_RANGES", 2):
+            summary = self.upload(worksheet)
+        self.assertEqual(summary["updated_cells"], 8)
+        self.assertTrue(all(
+            sum(len(update["values"][0]) for update in batch) <= 4 and len(batch) <= 2
+            for batch in worksheet.requests
+        ))
+        self.assertEqual(summary["requests"], len(worksheet.requests))
+        self.assertEqual(worksheet.get_all_values(), get_sheet_rows(self.strings_map, ["fr", "de"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from mtm.map import StringIndex, StringKey, StringsMap, string_index_to_dict
+from mtm.storage import SqliteStorage
+from mtm.strings import STRING_TYPE
+
+
+class SqliteLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "string_index.db")
+        indexes = [
+            StringIndex("Open", STRING_TYPE, translations={"fr": "Ouvrir", "de": ""}, keys=[StringKey("open", {}, "android")]),
+            StringIndex(
+                "{0} left", STRING_TYPE, translations={"fr": "{0} restant"},
+                keys=[StringKey("left", {0: "%s"}, "android"), StringKey("open", {0: "%@"}, "ios")]
+            ),
+        ]
+        self.strings_map = StringsMap(index={string_index.value: string_index for string_index in indexes})
+        storage = SqliteStorage(self.path)
+        storage.save(self.strings_map)
+        storage.close()
+
+    def test_lookups_match_the_loaded_index(self):
+        storage = SqliteStorage(self.path)
+        self.addCleanup(storage.close)
+        found = storage.find_indexes_by_key("open")
+        self.assertEqual(
+            [string_index_to_dict(string_index) for string_index in found],
+            [string_index_to_dict(self.strings_map.index[value]) for value in ("Open", "{0} left")]
+        )
+        self.assertEqual(storage.find_index_by_value("Open").translations, {"fr": "Ouvrir", "de": ""})
+        self.assertIsNone(storage.find_index_by_value("Close"))
+        self.assertEqual(storage.find_indexes_by_key("close"), [])
+        self.assertEqual(storage.find_translations_by_language("fr"), {"Open": "Ouvrir", "{0} left": "{0} restant"})
+
+    def test_lookups_do_not_load_the_index(self):
+        storage = SqliteStorage(self.path)
+        self.addCleanup(storage.close)
+        storage.find_indexes_by_key("open")
+        self.assertEqual(storage._rows, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
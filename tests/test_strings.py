@@ -0,0 +1,21 @@
+import unittest
+
+from mtm.android import AndroidStringFile
+from mtm.strings import STRING_TYPE, StringItem
+
+
+class InsertNewStringKeyTest(unittest.TestCase):
+
+    def test_sorted_values_stay_sorted(self):
+        values = [StringItem(key, STRING_TYPE, value=key, comments=[]) for key in ("b", "D", "f")]
+        string_file = AndroidStringFile("strings.xml", "fr", values=values)
+        self.assertEqual([value.key for value in string_file.sorted_values], ["b", "D", "f"])
+        for key in ("a", "C", "e", "g", "d"):
+            string_file.insert_new_string_key(key)
+        self.assertEqual([value.key for value in string_file.sorted_values], ["a", "b", "C", "D", "d", "e", "f", "g"])
+        self.assertEqual(string_file.sorted_values, sorted(string_file.values, key=lambda x: x.key.lower()))
+        self.assertEqual(len(string_file.values), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from mtm.map import StringIndex, StringKey, StringsMap
+from mtm.strings import STRING_TYPE
+from mtm.translation_memory import TranslationMemory, get_suggestions
+
+
+class SuggestionTest(unittest.TestCase):
+
+    def test_source_values_count_as_untranslated(self):
+        # propagated keys hold the source value until someone translates them
+        translated = StringIndex(
+            "Delete this account", STRING_TYPE, translations={"fr": "Supprimer ce compte", "de": "Delete this account"},
+            keys=[StringKey("delete", {})]
+        )
+        new = StringIndex(
+            "Delete this account?", STRING_TYPE, translations={"fr": "Delete this account?", "de": ""},
+            keys=[StringKey("delete_question", {})]
+        )
+        strings_map = StringsMap(index={string_index.value: string_index for string_index in (translated, new)})
+        memory = TranslationMemory()
+        memory.update(strings_map)
+        suggestions = get_suggestions(strings_map, memory, ["Delete this account?"], ["fr", "de"], 0.5)
+        self.assertEqual(list(suggestions), ["Delete this account?"])
+        self.assertEqual(suggestions["Delete this account?"]["fr"][0], "Supprimer ce compte")
+        self.assertNotIn("de", suggestions["Delete this account?"])
+
+
+if __name__ == "__main__":
+    unittest.main()
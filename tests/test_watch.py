@@ -0,0 +1,89 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from mtm import manager
+from mtm.output import capture
+from mtm.sheets import LocalWorksheet
+from mtm.watch import Watcher
+
+
+class IdleMonitor:
+
+    def wait(self, timeout):
+        return []
+
+    def close(self):
+        pass
+
+
+class WatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+        for language, value in (("", "open the app"), ("-fr", "ouvrir")):
+            os.makedirs(f"res/values{language}")
+            with open(f"res/values{language}/strings.xml", "w") as f:
+                f.write(f'<resources>\n    <string name="open">{value}</string>\n</resources>\n')
+        with open("config.json", "w") as f:
+            json.dump({
+                "string_index_filename": "string_index.json",
+                "sheets_api": {"spreadsheet_id": "local"},
+                "journal": True,
+                "applications": [{
+                    "platform": "android", "project_dir": ".", "strings_filename": "strings.xml",
+                    "languages": ["", "fr"], "default_language": "", "string_dirs": ["res/values"],
+                }],
+            }, f)
+        self.output = capture(io.StringIO())
+        self.output.__enter__()
+        self.addCleanup(self.output.__exit__, None, None, None)
+        manager.init("config.json")
+        self.session = manager.Session("config.json", worksheet=LocalWorksheet())
+        self.watcher = Watcher(self.session, monitor=IdleMonitor(), debounce=0)
+        self.watcher.start()
+
+    def read_index(self):
+        with open("string_index.json") as f, open("string_index.json.journal") as journal:
+            return f.read(), journal.read()
+
+    def test_failed_sync_is_not_persisted(self):
+        index = self.read_index()
+        with open("res/values-fr/strings.xml", "w") as f:
+            f.write('<resources>\n    <string name="open">ouvrir l\\\'app</string>\n</resources>\n')
+        map = self.session.map
+
+        def sync(*_):
+            map.set_translation("open the app", "fr", "half applied")
+            raise Exception("sync failed")
+
+        with mock.patch.object(map, "sync", side_effect=sync):
+            self.watcher.check(["res/values-fr/strings.xml"])
+        self.watcher.flush()
+        self.assertEqual(self.read_index(), index)
+        self.assertEqual(self.session.map.index["open the app"].translations["fr"], "ouvrir")
+
+    def test_changes_before_a_failed_sync_are_kept(self):
+        with open("res/values/strings.xml", "w") as f:
+            f.write('<resources>\n    <string name="open">open the app</string>\n    <string name="close">close</string>\n</resources>\n')
+        self.watcher.check(["res/values/strings.xml"])
+        with open("res/values-fr/strings.xml", "w") as f:
+            f.write('<resources>\n    <string name="open">ouvrir!</string>\n</resources>\n')
+        with mock.patch.object(self.session.map, "sync", side_effect=Exception("sync failed")):
+            self.watcher.check(["res/values-fr/strings.xml"])
+        self.watcher.flush()
+        with open("string_index.json") as f:
+            index = json.load(f)["index"]
+        self.assertIn("close", index)
+        self.assertEqual(index["open the app"]["translations"]["fr"], "ouvrir")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import json
+import os
+import stat
+import tempfile
+import unittest
+
+from mtm.writer import NEW_FILE_MODE, FileWriter, write_file
+
+
+class StreamTest(unittest.TestCase):
+
+    def test_streamed_files_are_compared_with_the_disk(self):
+        data = {f"value {position}": {"fr": f"valeur {position} é"} for position in range(5000)}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "string_index.json")
+            writer = FileWriter()
+            self.assertTrue(writer.write(path, lambda f: json.dump(data, f, indent=4, ensure_ascii=False), stream=True))
+            writer.flush()
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(json.load(f), data)
+            self.assertFalse(writer.write(path, lambda f: json.dump(data, f, indent=4, ensure_ascii=False), stream=True))
+            self.assertEqual((writer.written, writer.unchanged), ([path], [path]))
+            self.assertEqual(os.listdir(directory), ["string_index.json"])
+
+
+
+class ModeTest(unittest.TestCase):
+
+    def test_new_files_follow_the_umask(self):
+        umask = os.umask(0o022)
+        os.umask(umask)
+        self.assertEqual(NEW_FILE_MODE, 0o666 & ~umask)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "strings.xml")
+            write_file(path, lambda f: f.write("<resources/>\n"))
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), NEW_FILE_MODE)
+
+
+if __name__ == "__main__":
+    unittest.main()